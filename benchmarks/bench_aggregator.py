@@ -0,0 +1,111 @@
+"""
+Load test of the squadron aggregator: hundreds of simulated pilots push
+merit batches concurrently over keep-alive connections, some batches twice
+like a plugin retrying, then one squadron report goes to a local Discord stub.
+
+    python -m benchmarks.bench_aggregator [pilots] [batches per pilot]
+"""
+import os
+import sys
+import json
+import random
+import asyncio
+import tempfile
+from time import perf_counter
+
+from benchmarks.discord_stub import DiscordStub
+from meritmonitor.aggregator import Aggregator
+from meritmonitor.logger import set_global_log_file, set_log_level, stop_logging
+from meritmonitor.meritstore import weekly_key
+from meritmonitor.translations import Translations
+
+SYSTEMS = [f"Synthetic Sector {i:04d}" for i in range(300)]
+DELTAS_PER_BATCH = 20
+RETRY_RATIO = 0.05
+
+
+async def post(reader, writer, body: bytes) -> dict:
+    writer.write(b"POST /merits HTTP/1.1\r\nHost: aggregator\r\nContent-Type: application/json\r\n"
+                 b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+    await writer.drain()
+    status = await reader.readline()
+    length = 0
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+    assert status.split()[1] == b"200", status
+    return json.loads(await reader.readexactly(length))
+
+
+async def pilot(port: int, pilot_id: int, batches: int, week: int, totals: dict, latencies: list) -> None:
+    rng = random.Random(pilot_id)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for batch_index in range(batches):
+        deltas = []
+        for _ in range(DELTAS_PER_BATCH):
+            system = rng.choice(SYSTEMS)
+            merits = rng.randint(1, 400)
+            deltas.append([week, system, merits, merits // 4])
+            totals[system] = totals.get(system, 0) + merits // 4
+        body = json.dumps({"batch": f"pilot-{pilot_id}-{batch_index}", "deltas": deltas}).encode()
+        sends = 2 if rng.random() < RETRY_RATIO else 1
+        for _ in range(sends):
+            started = perf_counter()
+            await post(reader, writer, body)
+            latencies.append(perf_counter() - started)
+    writer.close()
+
+
+async def wait_for_discord(aggregator, timeout: float = 60) -> None:
+    """Wait until the publisher has sent every queued report."""
+    publisher = aggregator.publisher
+    deadline = perf_counter() + timeout
+    while publisher.reports or aggregator.db.next_outbox_attempt() is not None:
+        if perf_counter() > deadline:
+            raise TimeoutError("the report was not sent to the Discord stub")
+        await asyncio.sleep(0.05)
+
+
+async def run(pilots: int, batches: int, directory: str) -> None:
+    week = weekly_key()
+    translations = Translations(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lang"))
+    translations.load("English")
+    with DiscordStub() as stub:
+        aggregator = Aggregator(os.path.join(directory, "squadron.db"), stub.url, translations, interval=3600)
+        port = await aggregator.start("127.0.0.1", 0)
+        totals = {}
+        latencies = []
+        started = perf_counter()
+        await asyncio.gather(*(pilot(port, pilot_id, batches, week, totals, latencies) for pilot_id in range(pilots)))
+        elapsed = perf_counter() - started
+
+        merged = {system: control_points for system, _, control_points in aggregator.db.squadron_merits_by_system(week)}
+        assert merged == totals, "squadron totals don't match the pushed deltas"
+        published = perf_counter()
+        aggregator.publish_dirty_weeks()
+        await wait_for_discord(aggregator)
+        published = perf_counter() - published
+        await aggregator.stop()
+
+        latencies.sort()
+        requests = len(latencies)
+        print(f"{pilots} pilots, {requests} requests ({pilots * batches} batches, "
+              f"{requests - pilots * batches} retried) in {elapsed:.2f} s")
+        print(f"{requests / elapsed:.0f} requests/s, {pilots * batches * DELTAS_PER_BATCH / elapsed:.0f} deltas/s")
+        print(f"latency p50 {latencies[requests // 2] * 1000:.1f} ms, p99 {latencies[int(requests * 0.99)] * 1000:.1f} ms")
+        print(f"Discord: {len(stub.requests)} requests, {len(stub.messages)} messages "
+              f"for {len(merged)} systems in {published:.2f} s (instead of {pilots} reports)")
+
+
+def main():
+    pilots = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    batches = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    with tempfile.TemporaryDirectory() as directory:
+        set_global_log_file(os.path.join(directory, "aggregator.log"))
+        set_log_level("WARNING")
+        asyncio.run(run(pilots, batches, directory))
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
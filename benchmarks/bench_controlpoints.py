@@ -0,0 +1,90 @@
+"""
+Control points of a replay's worth of PowerplayMerits events: one call of
+the scalar function per event, as before, against the batch API with its
+pure-Python and NumPy paths, the latter from lists and from arrays. Every path is first checked against the scalar
+function, which is checked against the original formula.
+
+    python -m benchmarks.bench_controlpoints [events]
+"""
+import sys
+import random
+from time import perf_counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from meritmonitor import meritcalculator
+from meritmonitor.meritcalculator import (state_table, control_points_from_merits_gained, control_points_python,
+                                          control_points_numpy, control_points_from_merits_gained_batch)
+
+STATES = list(state_table) + ["InPrepareRadius", "Contested"]
+# Merits of common activities, plus rarer large amounts outside the lookup tables
+COMMON_MERITS = (4, 8, 12, 16, 24, 30, 50, 100, 150, 300, 1200)
+
+
+def original(system_state: str, net_merits: int) -> int:
+    """control_points_from_merits_gained before the lookup tables."""
+    multiplier = state_table.get(system_state, 1.0)
+    gross_merits = round(net_merits / multiplier)
+    return round(gross_merits * 0.25)
+
+
+def check(name: str, calculate, system_states: list[str], net_merits: list[int], expected: list[int]) -> None:
+    results = calculate(system_states, net_merits)
+    mismatches = sum(result != want for result, want in zip(results, expected))
+    assert len(results) == len(expected) and not mismatches, f"{name}: {mismatches} events differ"
+
+
+def timed(calculate, system_states: list[str], net_merits: list[int]) -> float:
+    started = perf_counter()
+    calculate(system_states, net_merits)
+    return perf_counter() - started
+
+
+def scalar(system_states: list[str], net_merits: list[int]) -> list[int]:
+    return [control_points_from_merits_gained(system_state, merits)
+            for system_state, merits in zip(system_states, net_merits)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(42)
+
+    # Every state with every amount in and just past the tables, and random amounts up to 10^7 of either sign
+    exhaustive_merits = list(range(-100, meritcalculator.CONTROL_POINTS_TABLE_SIZE + 100))
+    exhaustive_merits += [rng.randint(-10_000_000, 10_000_000) for _ in range(20_000)]
+    exhaustive_states = [state for state in STATES for _ in exhaustive_merits]
+    exhaustive_merits = exhaustive_merits * len(STATES)
+    expected = [original(state, merits) for state, merits in zip(exhaustive_states, exhaustive_merits)]
+    paths = [("scalar", scalar), ("batch (Python)", control_points_python)]
+    if numpy is not None:
+        paths.append(("batch (NumPy)", control_points_numpy))
+    for name, calculate in paths:
+        check(name, calculate, exhaustive_states, exhaustive_merits, expected)
+    if numpy is not None:
+        check("batch (NumPy array)", control_points_from_merits_gained_batch, exhaustive_states,
+              numpy.array(exhaustive_merits), expected)
+    print(f"{len(expected)} events give the same control points on every path")
+
+    system_states = [rng.choice(STATES) for _ in range(count)]
+    net_merits = [rng.choice(COMMON_MERITS) if rng.random() < 0.95 else rng.randint(1, 20_000) for _ in range(count)]
+    paths.insert(0, ("original", lambda states, merits: [original(state, event_merits)
+                                                         for state, event_merits in zip(states, merits)]))
+    baseline = None
+    if numpy is not None:
+        merits_array = numpy.array(net_merits)
+        paths.append(("batch (NumPy array)", lambda states, _: control_points_from_merits_gained_batch(states,
+                                                                                                    merits_array)))
+    for name, calculate in paths:
+        seconds = min(timed(calculate, system_states, net_merits) for _ in range(3))
+        baseline = baseline or seconds
+        print(f"{name:<20} {seconds * 1000:>8.1f} ms  {seconds / count * 1e9:>6.0f} ns/event  "
+              f"{baseline / seconds:>5.1f}x")
+    if numpy is None:
+        print("NumPy is not installed, the batch API uses the Python path")
+
+
+if __name__ == "__main__":
+    main()
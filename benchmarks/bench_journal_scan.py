@@ -0,0 +1,50 @@
+"""
+Cold journal scan benchmark: the original line-by-line json/strptime loop
+against the pre-filtering scanner in meritmonitor.journal.
+
+    python -m benchmarks.bench_journal_scan
+"""
+import json
+import tempfile
+from datetime import datetime, timezone
+from time import perf_counter
+
+from benchmarks.synthetic import generate_journals
+from meritmonitor.journal import JournalScan, scan_journal, json_loads
+
+
+def legacy_scan(path: str, since: datetime) -> JournalScan:
+    scan = JournalScan(path, int(since.timestamp()))
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            ts = datetime.strptime(entry["timestamp"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+            if ts < since:
+                continue
+            scan.process_entry(entry)
+    return scan
+
+
+def timed(function, paths, since):
+    start = perf_counter()
+    scans = [function(path, since) for path in paths]
+    return perf_counter() - start, scans
+
+
+def main():
+    since = datetime(2026, 10, 15, 7, 0, tzinfo=timezone.utc)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = generate_journals(directory, lines=500_000, files=20)
+        legacy_seconds, legacy_scans = timed(legacy_scan, paths, since)
+        fast_seconds, fast_scans = timed(lambda path, s: scan_journal(JournalScan(path, int(s.timestamp()))), paths, since)
+
+    for legacy, fast in zip(legacy_scans, fast_scans):
+        assert legacy.events == fast.events
+
+    print(f"json backend: {json_loads.__module__}")
+    print(f"legacy scan:  {legacy_seconds:.3f} s")
+    print(f"fast scan:    {fast_seconds:.3f} s ({legacy_seconds / fast_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
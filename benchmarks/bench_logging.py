@@ -0,0 +1,69 @@
+"""
+Backfill cost with merit logging on and off: scanned journal merits are
+applied to a MeritStore and logged per merit like the live worker does,
+through the synchronous file and console handlers used before and
+through the queue based logger at DEBUG (on) and INFO (off). Run with
+stderr redirected, e.g. 2>/dev/null.
+
+    python -m benchmarks.bench_logging
+"""
+import os
+import logging
+import tempfile
+from time import perf_counter
+
+from benchmarks.synthetic import generate_journals
+from meritmonitor.journal import JournalScan, scan_journal, parse_timestamp
+from meritmonitor.logger import get_logger, set_global_log_file, set_log_level, stop_logging
+from meritmonitor.meritstore import MeritStore
+
+
+def legacy_logger(path: str) -> logging.Logger:
+    logger = logging.getLogger("bench-legacy")
+    logger.setLevel(logging.DEBUG)
+    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    for handler in (logging.FileHandler(path, encoding="utf-8"), logging.StreamHandler()):
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    logger.propagate = False
+    return logger
+
+
+def backfill(events, logger, eager: bool) -> float:
+    store = MeritStore()
+    started = perf_counter()
+    for timestamp, commander, system, system_state, merits in events:
+        system = system or "Nepoznato"
+        system_state = system_state or "Unoccupied"
+        store.add_merits(system, system_state, merits, merits // 4, parse_timestamp(timestamp), commander or "")
+        if eager:
+            logger.info(f"Dodato: {merits} merita za {system} ({system_state})")
+        else:
+            logger.debug("Dodato: %s merita za %s (%s)", merits, system, system_state)
+    return perf_counter() - started
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = generate_journals(directory, lines=400_000, files=10, merit_ratio=0.1)
+        events = [event for path in paths for event in scan_journal(JournalScan(path, 0)).events]
+
+        set_global_log_file(os.path.join(directory, "queue.log"))
+        logger = get_logger("bench-queue")
+
+        legacy = backfill(events, legacy_logger(os.path.join(directory, "legacy.log")), eager=True)
+        set_log_level("DEBUG")
+        queued_on = backfill(events, logger, eager=False)
+        set_log_level("INFO")
+        queued_off = backfill(events, logger, eager=False)
+        stop_logging()
+        logging.getLogger("bench-legacy").handlers[0].close()
+
+    print(f"{len(events)} merit events")
+    print(f"sync handlers, f-string:    {legacy:.3f} s")
+    print(f"queue handler, DEBUG (on):   {queued_on:.3f} s")
+    print(f"queue handler, INFO (off):   {queued_off:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
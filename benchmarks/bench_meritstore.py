@@ -0,0 +1,53 @@
+"""
+MeritStore micro-benchmarks: running totals and adds with a growing number
+of systems, against the original sum over per-system dicts.
+
+    python -m benchmarks.bench_meritstore
+"""
+from timeit import timeit
+
+from meritmonitor.meritstore import MeritStore, weekly_key
+
+
+class LegacyMeritStore:
+    """The dict-of-dicts store from before running totals, for comparison."""
+
+    def __init__(self) -> None:
+        self.live_personal_by_system = {}
+
+    def add_personal(self, system: str, amount: int):
+        this_week = weekly_key()
+        self.live_personal_by_system.setdefault(this_week, {}).setdefault(system, 0)
+        self.live_personal_by_system[this_week][system] += amount
+
+    def sum_personal(self) -> int:
+        this_week = weekly_key()
+        self.live_personal_by_system.setdefault(this_week, {})
+        return sum(self.live_personal_by_system[this_week].values())
+
+
+def per_call_us(statement, number: int) -> float:
+    return timeit(statement, number=number) / number * 1e6
+
+
+def main():
+    print(f"{'systems':>8} {'legacy sum':>12} {'sum':>10} {'legacy add':>12} {'add':>10}   (µs per call)")
+    for systems in (10, 1_000, 10_000, 50_000):
+        names = [f"Synthetic Sector {i:05d}" for i in range(systems)]
+        legacy = LegacyMeritStore()
+        store = MeritStore()
+        for name in names:
+            legacy.add_personal(name, 10)
+            store.add_merits(name, "Fortified", 10, 4)
+        assert legacy.sum_personal() == store.sum_personal()
+
+        number = max(100, 200_000 // systems)
+        legacy_sum = per_call_us(legacy.sum_personal, number)
+        store_sum = per_call_us(store.sum_personal, 100_000)
+        legacy_add = per_call_us(lambda: legacy.add_personal(names[-1], 1), 20_000)
+        store_add = per_call_us(lambda: store.add_merits(names[-1], "Fortified", 1, 0), 20_000)
+        print(f"{systems:>8} {legacy_sum:>12.2f} {store_sum:>10.2f} {legacy_add:>12.2f} {store_add:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Line scanner against the mmap scanner on a multi-GB synthetic journal
+directory: wall time and peak RSS, each scanner in a fresh process.
+Peak RSS needs the `resource` module, so Unix only.
+
+    python -m benchmarks.bench_mmap_scan [gigabytes]
+"""
+import os
+import sys
+import tempfile
+import multiprocessing
+from time import perf_counter
+
+from benchmarks.synthetic import generate_journals
+from meritmonitor.journal import JournalScan, scan_journal
+
+AVERAGE_LINE_BYTES = 165
+LINES_PER_FILE = 500_000
+
+
+def peak_rss_mb() -> float:
+    import resource
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def run_scanner(scanner: str, paths: list[str], results) -> None:
+    baseline = peak_rss_mb()
+    started = perf_counter()
+    events = sum(len(scan_journal(JournalScan(path, 0), scanner).events) for path in paths)
+    results.put((scanner, perf_counter() - started, peak_rss_mb(), baseline, events))
+
+
+def main():
+    gigabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    lines = int(gigabytes * 1024 ** 3 / AVERAGE_LINE_BYTES)
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = generate_journals(directory, lines=lines, files=max(1, lines // LINES_PER_FILE))
+        total = sum(os.path.getsize(path) for path in paths)
+        print(f"{len(paths)} files, {total / 1024 ** 3:.2f} GB")
+        print(f"{'scanner':>8} {'wall s':>8} {'peak RSS MB':>12} {'start RSS MB':>13} {'events':>8}")
+        for scanner in ("lines", "mmap"):
+            results = context.Queue()
+            process = context.Process(target=run_scanner, args=(scanner, paths, results))
+            process.start()
+            name, seconds, peak, baseline, events = results.get()
+            process.join()
+            print(f"{name:>8} {seconds:>8.2f} {peak:>12.1f} {baseline:>13.1f} {events:>8}")
+
+
+if __name__ == "__main__":
+    main()
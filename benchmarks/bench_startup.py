@@ -0,0 +1,106 @@
+"""
+Time-to-first-total at plugin startup: importing the plugin's modules, then
+either rebuilding this week's totals from the ledger (before snapshots) or
+restoring them from the snapshot, and the journal reconcile that follows.
+
+    python -m benchmarks.bench_startup [lines] [systems]
+"""
+import os
+import sys
+import tempfile
+import subprocess
+from statistics import median
+from time import perf_counter
+
+from benchmarks.synthetic import generate_journals
+from meritmonitor.database import Database
+from meritmonitor.meritstore import MeritStore
+from meritmonitor.tracker import MeritTracker
+from meritmonitor.snapshot import save_snapshot, load_snapshot
+from meritmonitor.thursday import get_last_thursday
+from meritmonitor.logger import get_logger, set_global_log_file, set_log_level, stop_logging
+
+IMPORT_PLUGIN = "import meritmonitor.publisher, meritmonitor.tracker, meritmonitor.snapshot"
+REPEAT = 20
+
+
+def import_ms(statement: str) -> float:
+    """Milliseconds `statement` takes in a fresh interpreter."""
+    script = f"from time import perf_counter\nstarted = perf_counter()\n{statement}\nprint(perf_counter() - started)"
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return float(result.stdout) * 1000
+
+
+def best_import_ms(statement: str) -> float:
+    return min(import_ms(statement) for _ in range(5))
+
+
+def from_ledger(db_path: str) -> tuple[float, int]:
+    started = perf_counter()
+    db = Database(db_path)
+    merit_store = MeritStore(db)
+    merit_store.load()
+    total = merit_store.sum_system()
+    elapsed = perf_counter() - started
+    db.close()
+    return elapsed, total
+
+
+def from_snapshot(snapshot_path: str) -> tuple[float, int]:
+    started = perf_counter()
+    merit_store = MeritStore()
+    merit_store.restore_snapshot(load_snapshot(snapshot_path))
+    total = merit_store.sum_system()
+    return perf_counter() - started, total
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    systems = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    with tempfile.TemporaryDirectory() as directory:
+        set_global_log_file(os.path.join(directory, "startup.log"))
+        set_log_level("WARNING")
+        journal_dir = os.path.join(directory, "journals")
+        os.mkdir(journal_dir)
+        generate_journals(journal_dir, lines, 10, systems, start=get_last_thursday())
+        db_path = os.path.join(directory, "merits.db")
+        snapshot_path = os.path.join(directory, "snapshot.json")
+
+        db = Database(db_path)
+        tracker = MeritTracker(MeritStore(db), db, journal_dir, logger=get_logger())
+        started = perf_counter()
+        tracker.load_full_pp_cycle()
+        cold = perf_counter() - started
+        save_snapshot(snapshot_path, tracker.merit_store, db.ledger_revision(), tracker.last_seen_commander,
+                      tracker.last_seen_system, tracker.last_seen_system_state)
+        db.close()
+
+        with_requests = best_import_ms(IMPORT_PLUGIN + ", requests")
+        lazy = best_import_ms(IMPORT_PLUGIN)
+        ledger = [from_ledger(db_path) for _ in range(REPEAT)]
+        snapshot = [from_snapshot(snapshot_path) for _ in range(REPEAT)]
+        assert ledger[0][1] == snapshot[0][1], "the snapshot totals don't match the ledger"
+
+        db = Database(db_path)
+        tracker = MeritTracker(MeritStore(db), db, journal_dir, logger=get_logger())
+        tracker.merit_store.load()
+        started = perf_counter()
+        tracker.load_full_pp_cycle()
+        reconcile = perf_counter() - started
+        db.close()
+
+        ledger_ms = median(elapsed for elapsed, _ in ledger) * 1000
+        snapshot_ms = median(elapsed for elapsed, _ in snapshot) * 1000
+        print(f"{lines} journal lines, {systems} systems, {snapshot[0][1]} control points")
+        print(f"cold load of the PP cycle: {cold * 1000:.1f} ms")
+        print(f"imports: {with_requests:.1f} ms with requests, {lazy:.1f} ms with requests deferred")
+        print(f"first total: {ledger_ms:.2f} ms from the ledger, {snapshot_ms:.2f} ms from the snapshot "
+              f"({os.path.getsize(snapshot_path)} bytes)")
+        print(f"time-to-first-total: before {with_requests + ledger_ms:.1f} ms, after {lazy + snapshot_ms:.1f} ms")
+        print(f"background reconcile after restart: {reconcile * 1000:.1f} ms")
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
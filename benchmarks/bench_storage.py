@@ -0,0 +1,176 @@
+"""
+Sustained merit inserts from several threads while other threads run the
+report queries, on the storage engine (WAL, one writer thread committing the
+queued writes together, read-only connections for the queries) against the
+storage of earlier releases (rollback journal, one connection per thread,
+each committing its own writes).
+
+    python -m benchmarks.bench_storage [seconds] [writer threads] [reader threads] [rows per insert]
+"""
+import os
+import sys
+import random
+import sqlite3
+import tempfile
+from statistics import median
+from threading import Thread, Event
+from time import perf_counter
+
+from meritmonitor.database import Database, ROLLUP_UPSERTS, sum_rollups
+from meritmonitor.metrics import get_metrics
+from meritmonitor.thursday import week_start, SECONDS_PER_WEEK
+from meritmonitor.logger import set_global_log_file, set_log_level, stop_logging
+
+SYSTEMS = 300
+WEEK = week_start(1_790_000_000)
+INSERT_MERITS = ("INSERT INTO merits (timestamp, week, commander, system_id, system_state, merits, control_points) "
+                 "VALUES (?, ?, ?, ?, ?, ?, ?)")
+INSERT_FINGERPRINTS = "INSERT OR IGNORE INTO merit_fingerprints (week, fingerprint) VALUES (?, ?)"
+SAVE_CHECKPOINT = ("INSERT OR REPLACE INTO journal_checkpoints "
+                   "(path, since, size, mtime, offset, system, system_state, commander) VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+TOP_SYSTEMS = """
+    SELECT systems.name, SUM(rollup_systems.merits), SUM(rollup_systems.control_points)
+    FROM rollup_systems
+    JOIN systems ON systems.id = rollup_systems.system_id
+    WHERE rollup_systems.week >= ?
+    GROUP BY rollup_systems.system_id
+    ORDER BY SUM(rollup_systems.control_points) DESC, systems.name
+    LIMIT 10
+"""
+
+
+def merit_rows(rng: random.Random, writer: int, count: int) -> tuple[list[tuple], list[tuple]]:
+    """Ledger rows and fingerprints of `count` merit events."""
+    rows = []
+    for _ in range(count):
+        merits = rng.choice((4, 8, 12, 50, 100))
+        rows.append((WEEK + rng.randrange(SECONDS_PER_WEEK), WEEK, f"Cmdr {writer}", rng.randrange(1, SYSTEMS + 1),
+                     "Fortified", merits, merits // 2))
+    return rows, [(WEEK, rng.getrandbits(63)) for _ in rows]
+
+
+class Engine:
+    """The storage engine, through `Database`."""
+    name = "storage engine (WAL, writer thread)"
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+
+    def writer(self, stop: Event, writer: int, batch: int, counts: list) -> None:
+        rng = random.Random(writer)
+        db = Database(self.db_path)
+        while not stop.is_set():
+            rows, fingerprints = merit_rows(rng, writer, batch)
+            db.insert_merits(rows, fingerprints)
+            db.save_journal_checkpoints([(f"Journal.{writer}.log", WEEK, 1, 1.0, 1, "S", "Fortified", "Cmdr")])
+            counts[writer] += len(rows)
+        db.close()
+
+    def reader(self, stop: Event, latencies: list) -> None:
+        db = Database(self.db_path, read_only=True)
+        while not stop.is_set():
+            started = perf_counter()
+            db.sum_merits_by_system(WEEK)
+            db.top_systems(WEEK, 10)
+            db.merits_by_week(WEEK)
+            latencies.append(perf_counter() - started)
+        db.close()
+
+
+class Legacy:
+    """A default-mode connection per thread, committing every insert, like the releases before the engine."""
+    name = "earlier releases (rollback journal)"
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.close()
+        self.errors = 0
+
+    def writer(self, stop: Event, writer: int, batch: int, counts: list) -> None:
+        rng = random.Random(writer)
+        conn = sqlite3.connect(self.db_path)
+        while not stop.is_set():
+            rows, fingerprints = merit_rows(rng, writer, batch)
+            try:
+                with conn:
+                    conn.executemany(INSERT_MERITS, rows)
+                    for table, rollup_rows in sum_rollups(rows).items():
+                        conn.executemany(ROLLUP_UPSERTS[table], rollup_rows)
+                    conn.executemany(INSERT_FINGERPRINTS, fingerprints)
+                with conn:
+                    conn.execute(SAVE_CHECKPOINT, (f"Journal.{writer}.log", WEEK, 1, 1.0, 1, "S", "Fortified", "Cmdr"))
+            except sqlite3.OperationalError:
+                self.errors += 1
+                continue
+            counts[writer] += len(rows)
+        conn.close()
+
+    def reader(self, stop: Event, latencies: list) -> None:
+        conn = sqlite3.connect(self.db_path)
+        while not stop.is_set():
+            started = perf_counter()
+            try:
+                conn.execute("SELECT commander, system_id, merits, control_points FROM rollup_systems WHERE week = ?",
+                             (WEEK,)).fetchall()
+                conn.execute(TOP_SYSTEMS, (WEEK,)).fetchall()
+                conn.execute("SELECT week, SUM(merits), SUM(control_points) FROM rollup_weekly WHERE week >= ? "
+                             "GROUP BY week ORDER BY week", (WEEK,)).fetchall()
+            except sqlite3.OperationalError:
+                self.errors += 1
+                continue
+            latencies.append(perf_counter() - started)
+        conn.close()
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def run(storage, seconds: float, writers: int, readers: int, batch: int) -> None:
+    stop = Event()
+    counts = [0] * writers
+    latencies: list[list[float]] = [[] for _ in range(readers)]
+    threads = [Thread(target=storage.writer, args=(stop, writer, batch, counts)) for writer in range(writers)]
+    threads += [Thread(target=storage.reader, args=(stop, latencies[reader])) for reader in range(readers)]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+    queries = [latency for reader in latencies for latency in reader]
+    print(f"{storage.name}:")
+    print(f"  {sum(counts) / elapsed:,.0f} merit rows/s from {writers} threads, {batch} rows per insert")
+    print(f"  {len(queries) / elapsed:,.0f} reports/s from {readers} threads, latency p50 "
+          f"{median(queries) * 1000 if queries else 0:.2f} ms, p99 {percentile(queries, 0.99) * 1000:.2f} ms")
+    if isinstance(storage, Legacy):
+        print(f"  {storage.errors} inserts or reports failed with a locked database")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    batch = int(sys.argv[4]) if len(sys.argv) > 4 else 20
+    with tempfile.TemporaryDirectory() as directory:
+        set_global_log_file(os.path.join(directory, "storage.log"))
+        set_log_level("WARNING")
+        for storage_class in (Legacy, Engine):
+            db_path = os.path.join(directory, f"{storage_class.__name__.lower()}.db")
+            db = Database(db_path)
+            for system in range(1, SYSTEMS + 1):
+                db.insert_system(f"Synthetic Sector {system:04d}")
+            db.close()
+            run(storage_class(db_path), seconds, writers, readers, batch)
+        groups = get_metrics().histogram("database.write_group_size")
+        print(f"writes per transaction of the engine: mean {groups.total / max(groups.count, 1):.1f}, "
+              f"max {groups.max or 0}")
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
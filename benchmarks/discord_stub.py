@@ -0,0 +1,97 @@
+"""Local stand-in for a Discord webhook, recording the requests it gets."""
+import json
+import threading
+from time import monotonic
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class DiscordStub:
+    """
+    Answers webhook POST, PATCH and DELETE requests like Discord does, with an
+    ID for each new message. `rate_limit` requests are allowed per
+    `reset_after` seconds, the ones over it get a 429, and every response has
+    Discord's X-RateLimit-* headers. A `rate_limit` of 0 means no limit.
+    The first `fail_first` requests fail with a 500 and change nothing.
+    """
+
+    def __init__(self, rate_limit: int = 5, reset_after: float = 2.0, fail_first: int = 0) -> None:
+        self.requests: list[tuple[str, str, dict | None]] = []
+        self.messages: dict[str, str] = {}
+        self.rate_limit = rate_limit
+        self.reset_after = reset_after
+        self.fail_first = fail_first
+        self.lock = threading.Lock()
+        self.window_ends = 0.0
+        self.window_requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/webhooks/1/token"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, Nagle would hold the body back for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status: int, payload: dict | None = None, headers: dict | None = None):
+                body = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def handle_request(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length)) if length else None
+                with stub.lock:
+                    stub.requests.append((self.command, self.path, payload))
+                    failed = len(stub.requests) <= stub.fail_first
+                if failed:
+                    self.reply(500, {"message": "Internal Server Error"})
+                    return
+                with stub.lock:
+                    now = monotonic()
+                    if now >= stub.window_ends:
+                        stub.window_ends = now + stub.reset_after
+                        stub.window_requests = 0
+                    stub.window_requests += 1
+                    limited = stub.rate_limit and stub.window_requests > stub.rate_limit
+                    remaining = max(0, stub.rate_limit - stub.window_requests)
+                    reset_after = stub.window_ends - now
+                    message_id = self.path.rsplit("/", 1)[1] if "/messages/" in self.path else str(len(stub.requests))
+                    if not limited:
+                        if self.command == "DELETE":
+                            stub.messages.pop(message_id, None)
+                        else:
+                            stub.messages[message_id] = payload["content"]
+                headers = {}
+                if stub.rate_limit:
+                    headers = {"X-RateLimit-Limit": str(stub.rate_limit), "X-RateLimit-Remaining": str(remaining),
+                               "X-RateLimit-Reset-After": f"{reset_after:.3f}"}
+                if limited:
+                    self.reply(429, {"message": "You are being rate limited.", "retry_after": reset_after},
+                               dict(headers, **{"Retry-After": f"{reset_after:.3f}"}))
+                elif self.command == "DELETE":
+                    self.reply(204, None, headers)
+                else:
+                    self.reply(200, {"id": message_id, "content": payload["content"]}, headers)
+
+            do_POST = do_PATCH = do_DELETE = handle_request
+
+        return Handler
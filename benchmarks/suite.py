@@ -0,0 +1,261 @@
+"""
+Benchmark suite: cold PP cycle load, warm reload, per-entry worker
+throughput, report rendering and end-to-end publishing to a local Discord
+stub, all on seeded synthetic journals. Results are written as JSON, and
+compared against an earlier run with --compare, which exits with status 1
+when a benchmark got slower by more than --threshold.
+
+    python -m benchmarks.suite [--lines 200000] [--output results.json] [--compare baseline.json]
+"""
+import os
+import sys
+import json
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from time import perf_counter, sleep
+
+from benchmarks.discord_stub import DiscordStub
+from benchmarks.synthetic import generate_journals
+from meritmonitor.aggregator import AggregatorSettings
+from meritmonitor.database import Database
+from meritmonitor.journal import json_loads
+from meritmonitor.meritstore import MeritStore
+from meritmonitor.publisher import DiscordPublisher, chunk_report
+from meritmonitor.tracker import MeritTracker
+from meritmonitor.translations import Translations
+from meritmonitor.logger import get_logger, set_global_log_file, set_log_level, stop_logging
+
+START = datetime(2026, 10, 15, 7, 0, tzinfo=timezone.utc)
+REPORT_HEADER = "📊 **Sistemski meriti po sistemima:**\n\n"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def best(runs: list[float]) -> float:
+    return min(runs)
+
+
+def bench_cold_load(args, directory: str, journal_dir: str) -> dict:
+    """Load the PP cycle into an empty database, like the first start of the plugin."""
+    runs = []
+    for run in range(args.repeat):
+        db = Database(os.path.join(directory, f"cold-{run}.db"))
+        tracker = MeritTracker(MeritStore(db), db, journal_dir, args.workers, args.scanner, get_logger())
+        started = perf_counter()
+        tracker.load_merits_since(START)
+        runs.append(perf_counter() - started)
+        control_points = tracker.merit_store.sum_system(week=int(START.timestamp()))
+        db.close()
+    return {"seconds": best(runs), "runs": runs, "lines_per_second": args.lines / best(runs),
+            "control_points": control_points}
+
+
+def bench_warm_reload(args, directory: str, journal_dir: str) -> dict:
+    """Load the PP cycle again from the checkpoints, like every later start of the plugin."""
+    runs = []
+    db = Database(os.path.join(directory, "cold-0.db"))
+    for _ in range(args.repeat):
+        tracker = MeritTracker(MeritStore(db), db, journal_dir, args.workers, args.scanner, get_logger())
+        started = perf_counter()
+        tracker.load_merits_since(START)
+        runs.append(perf_counter() - started)
+    db.close()
+    return {"seconds": best(runs), "runs": runs}
+
+
+def journal_entries(journal_dir: str, count: int) -> list[dict]:
+    entries = []
+    for name in sorted(os.listdir(journal_dir)):
+        with open(os.path.join(journal_dir, name), "rb") as f:
+            for line in f:
+                entries.append(json_loads(line))
+                if len(entries) == count:
+                    return entries
+    return entries
+
+
+def bench_worker_throughput(args, directory: str, journal_dir: str) -> dict:
+    """Live journal entries through `process_journal_entry`, merits saved to the ledger in batches."""
+    entries = journal_entries(journal_dir, args.entries)
+    runs = []
+    for run in range(args.repeat):
+        db = Database(os.path.join(directory, f"worker-{run}.db"))
+        tracker = MeritTracker(MeritStore(db), db, logger=get_logger())
+        started = perf_counter()
+        for entry in entries:
+            tracker.process_journal_entry(entry, cmdr="Synthetic")
+        tracker.merit_store.flush()
+        runs.append(perf_counter() - started)
+        db.close()
+    return {"seconds": best(runs), "runs": runs, "entries": len(entries),
+            "entries_per_second": len(entries) / best(runs), "us_per_entry": best(runs) / len(entries) * 1e6}
+
+
+def bench_report_rendering(args, directory: str, journal_dir: str) -> dict:
+    """Report lines and chunks after every change of the merits, `args.renders` times."""
+    merit_store = MeritStore()
+    names = [f"Synthetic Sector {i:04d}" for i in range(args.systems)]
+    for name in names:
+        merit_store.add_merits(name, "Fortified", 100, 25)
+    runs = []
+    for _ in range(args.repeat):
+        started = perf_counter()
+        for render in range(args.renders):
+            merit_store.add_merits(names[render % len(names)], "Fortified", 4, 1)
+            chunks = chunk_report(REPORT_HEADER, merit_store.get_control_points_by_system_lines())
+        runs.append(perf_counter() - started)
+    return {"seconds": best(runs), "runs": runs, "chunks": len(chunks),
+            "us_per_render": best(runs) / args.renders * 1e6}
+
+
+def wait_until_sent(stub: DiscordStub, chunks: list[str], timeout: float = 60) -> None:
+    """Wait until the messages on the Discord stub are the chunks of the report."""
+    expected = sorted(chunks)
+    deadline = perf_counter() + timeout
+    while True:
+        with stub.lock:
+            if sorted(stub.messages.values()) == expected:
+                return
+        if perf_counter() > deadline:
+            raise TimeoutError("the report was not sent to the Discord stub")
+        sleep(0.001)
+
+
+def bench_publish_end_to_end(args, directory: str, journal_dir: str) -> dict:
+    """
+    Post a report of `args.systems` systems to the Discord stub, then the same
+    report with one system changed, which only sends the chunk it is in.
+    """
+    translations = Translations(os.path.join(ROOT, "lang"))
+    translations.load("English")
+    merit_store = MeritStore()
+    names = [f"Synthetic Sector {i:04d}" for i in range(args.systems)]
+    for name in names:
+        merit_store.add_merits(name, "Fortified", 100, 25)
+    first_runs, update_runs = [], []
+    with DiscordStub(rate_limit=args.rate_limit) as stub:
+        for run in range(args.repeat):
+            publisher = DiscordPublisher(os.path.join(directory, f"publish-{run}.db"), AggregatorSettings(stub.url),
+                                         translations, lambda text: None)
+            publisher.start()
+            stub.messages.clear()
+            requests_before = len(stub.requests)
+            started = perf_counter()
+            chunks = chunk_report(REPORT_HEADER, merit_store.get_control_points_by_system_lines())
+            publisher.publish(chunks, 1)
+            wait_until_sent(stub, chunks)
+            first_runs.append(perf_counter() - started)
+            first_requests = len(stub.requests) - requests_before
+
+            merit_store.add_merits(names[run % len(names)], "Fortified", 4, 1)
+            requests_before = len(stub.requests)
+            started = perf_counter()
+            chunks = chunk_report(REPORT_HEADER, merit_store.get_control_points_by_system_lines())
+            publisher.publish(chunks, 1)
+            wait_until_sent(stub, chunks)
+            update_runs.append(perf_counter() - started)
+            update_requests = len(stub.requests) - requests_before
+            publisher.stop()
+    return {"seconds": best(first_runs) + best(update_runs), "first_report_seconds": best(first_runs),
+            "update_seconds": best(update_runs), "first_report_requests": first_requests,
+            "update_requests": update_requests}
+
+
+BENCHMARKS = {
+    "cold_load": bench_cold_load,
+    "warm_reload": bench_warm_reload,
+    "worker_throughput": bench_worker_throughput,
+    "report_rendering": bench_report_rendering,
+    "publish_end_to_end": bench_publish_end_to_end,
+}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=ROOT).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Benchmarks that took more than `threshold` longer than in `baseline`."""
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if not before or not before.get("seconds"):
+            continue
+        change = result["seconds"] / before["seconds"] - 1
+        if change > threshold:
+            regressions.append(f"{name}: {before['seconds'] * 1000:.1f} ms -> {result['seconds'] * 1000:.1f} ms "
+                               f"(+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description="MeritMonitor benchmark suite")
+    parser.add_argument("--lines", type=int, default=200_000, help="synthetic journal lines")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--systems", type=int, default=300)
+    parser.add_argument("--merit-ratio", type=float, default=0.005)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--entries", type=int, default=100_000, help="journal entries for worker_throughput")
+    parser.add_argument("--renders", type=int, default=1_000, help="renders for report_rendering")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--scanner", default="lines")
+    parser.add_argument("--rate-limit", type=int, default=0,
+                        help="Discord stub requests per 2 s for publish_end_to_end, 0 for no limit")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the fastest one counts")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.20, help="slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parameters": {name: value for name, value in vars(args).items()
+                           if name not in ("only", "output", "compare", "threshold")},
+        },
+        "benchmarks": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        set_global_log_file(os.path.join(directory, "suite.log"))
+        set_log_level("WARNING")
+        journal_dir = os.path.join(directory, "journals")
+        os.mkdir(journal_dir)
+        generate_journals(journal_dir, args.lines, args.files, args.systems, args.merit_ratio, start=START,
+                          seed=args.seed)
+        for name, benchmark in BENCHMARKS.items():
+            if args.only and name not in args.only:
+                continue
+            result = benchmark(args, directory, journal_dir)
+            results["benchmarks"][name] = result
+            print(f"{name:<20} {result['seconds'] * 1000:>10.1f} ms", file=sys.stderr)
+        stop_logging()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Seeded generator for synthetic Elite Dangerous journal files.
+
+    python -m benchmarks.synthetic DIRECTORY [--lines 200000] [--weeks 4] [--part-lines 50000]
+"""
+import os
+import json
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from meritmonitor.thursday import SECONDS_PER_WEEK
+
+NOISE_EVENTS = [
+    ("Music", {"MusicTrack": "Supercruise"}),
+    ("ReceiveText", {"From": "", "Message": "$COMMS_entered:#name=Supercruise;", "Channel": "npc"}),
+    ("FSSSignalDiscovered", {"SystemAddress": 5068732442121, "SignalName": "$MULTIPLAYER_SCENARIO42_TITLE;",
+                             "SignalType": "Combat", "IsStation": False}),
+    ("ShipTargeted", {"TargetLocked": True, "Ship": "federation_dropship_mkii", "ScanStage": 3,
+                      "PilotName": "$npc_name_decorate:#name=Jax Oliver;", "PilotRank": "Deadly",
+                      "ShieldHealth": 100.0, "HullHealth": 100.0, "Faction": "Nakato Kaine",
+                      "LegalStatus": "Enemy", "Power": "Nakato Kaine"}),
+    ("UnderAttack", {"Target": "You"}),
+    ("Bounty", {"Rewards": [{"Faction": "Nakato Kaine", "Reward": 120340}], "Target": "federation_dropship_mkii",
+                "TotalReward": 120340, "VictimFaction": "Federal Navy"}),
+    ("Scan", {"ScanType": "AutoScan", "BodyName": "Col 285 Sector AB-C d1 2", "BodyID": 4, "DistanceFromArrivalLS": 812.5,
+              "TidalLock": False, "TerraformState": "", "PlanetClass": "Icy body", "MassEM": 0.0123,
+              "Radius": 1825000.0, "SurfaceGravity": 1.47, "SurfaceTemperature": 54.2}),
+    ("FuelScoop", {"Scooped": 4.2, "Total": 32.0}),
+    ("Cargo", {"Vessel": "Ship", "Count": 0}),
+    ("ReservoirReplenished", {"FuelMain": 30.1, "FuelReservoir": 0.63}),
+]
+POWERPLAY_STATES = ["Unoccupied", "Exploited", "Fortified", "Stronghold", "Controlled"]
+
+
+def journal_line(timestamp: datetime, event: str, fields: dict) -> str:
+    entry = {"timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"), "event": event}
+    entry.update(fields)
+    return json.dumps(entry, separators=(", ", ":")) + "\n"
+
+
+def generate_journals(directory: str, lines: int = 200_000, files: int = 10, systems: int = 50,
+                      merit_ratio: float = 0.005, jump_ratio: float = 0.002,
+                      start: datetime | None = None, seed: int = 42, weeks: float | None = None,
+                      event_mix: dict[str, float] | None = None, part_lines: int = 0) -> list[str]:
+    """
+    Write `files` game sessions with `lines` entries in total and return the paths of their journal files.
+    `merit_ratio` and `jump_ratio` are the share of PowerplayMerits and FSDJump lines, the other lines are
+    picked from NOISE_EVENTS, weighted by `event_mix` (event name to weight) if given.
+
+    Entries are 0-3 seconds apart, or spread evenly over `weeks` PP cycles
+    from `start`. A session longer than `part_lines` rolls over to a new part
+    file after a Continued event, like the game does.
+    """
+    rng = random.Random(seed)
+    start = start or datetime(2026, 10, 15, 7, 0, tzinfo=timezone.utc)
+    system_names = [f"Synthetic Sector {i:04d}" for i in range(systems)]
+    noise_weights = [event_mix.get(event, 0) for event, _ in NOISE_EVENTS] if event_mix else None
+    max_step = max(1, round(2 * weeks * SECONDS_PER_WEEK / lines)) if weeks else 3
+    paths = []
+    timestamp = start
+    lines_per_file = max(1, lines // files)
+    for _ in range(files):
+        session = timestamp.strftime('%Y-%m-%dT%H%M%S')
+        part = 1
+        f = open_part(directory, session, part, timestamp, paths)
+        f.write(journal_line(timestamp, "Commander", {"FID": "F1234567", "Name": "Synthetic"}))
+        for line in range(lines_per_file):
+            if part_lines and line and line % part_lines == 0:
+                part += 1
+                f.write(journal_line(timestamp, "Continued", {"Part": part}))
+                f.close()
+                f = open_part(directory, session, part, timestamp, paths)
+            timestamp += timedelta(seconds=rng.randint(0, max_step))
+            roll = rng.random()
+            if roll < jump_ratio:
+                f.write(journal_line(timestamp, "FSDJump", {"StarSystem": rng.choice(system_names),
+                                                            "PowerplayState": rng.choice(POWERPLAY_STATES),
+                                                            "JumpDist": 12.3, "FuelUsed": 1.2}))
+            elif roll < jump_ratio + merit_ratio:
+                f.write(journal_line(timestamp, "PowerplayMerits", {"Power": "Nakato Kaine",
+                                                                    "MeritsGained": rng.randint(1, 400),
+                                                                    "TotalMerits": 100000}))
+            else:
+                if noise_weights:
+                    event, fields = rng.choices(NOISE_EVENTS, noise_weights)[0]
+                else:
+                    event, fields = rng.choice(NOISE_EVENTS)
+                f.write(journal_line(timestamp, event, fields))
+        f.close()
+    return paths
+
+
+def open_part(directory: str, session: str, part: int, timestamp: datetime, paths: list[str]):
+    path = os.path.join(directory, f"Journal.{session}.{part:02d}.log")
+    paths.append(path)
+    f = open(path, "w", encoding="utf-8")
+    f.write(journal_line(timestamp, "Fileheader", {"part": part, "language": "English/UK", "Odyssey": True,
+                                                    "gameversion": "4.0.0.1904", "build": "r308767/r0 "}))
+    return f
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.synthetic",
+                                     description="Write a seeded set of synthetic journal files")
+    parser.add_argument("directory")
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--files", type=int, default=10, help="game sessions")
+    parser.add_argument("--systems", type=int, default=50)
+    parser.add_argument("--weeks", type=float, help="spread the entries over this many PP cycles")
+    parser.add_argument("--merit-ratio", type=float, default=0.005)
+    parser.add_argument("--jump-ratio", type=float, default=0.002)
+    parser.add_argument("--event-mix", type=json.loads, help='noise event weights, e.g. \'{"Music": 5, "Scan": 1}\'')
+    parser.add_argument("--part-lines", type=int, default=0, help="roll sessions over to a new part file")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="UTC, 2026-10-15T07:00 by default")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    start = args.start.replace(tzinfo=args.start.tzinfo or timezone.utc) if args.start else None
+    paths = generate_journals(args.directory, args.lines, args.files, args.systems, args.merit_ratio,
+                              args.jump_ratio, start, args.seed, args.weeks, args.event_mix, args.part_lines)
+    print(f"{len(paths)} journal files in {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
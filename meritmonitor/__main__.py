@@ -0,0 +1,118 @@
+"""
+Headless merit totals straight from the journal files, without EDMC, the GUI
+or a database:
+
+    python -m meritmonitor JOURNAL_DIR [--since 2025-06-05T07:00] [--until ...]
+                           [--format json|csv] [--workers 4] [--profile startup]
+
+Prints the merits and control points of each system earned in the window,
+by default from the start of the current PP cycle until now.
+"""
+import os
+import sys
+import csv
+import json
+import argparse
+from datetime import datetime, timezone
+
+from meritmonitor.tracker import MeritTracker
+from meritmonitor.journal import JOURNAL_SCANNERS
+from meritmonitor.thursday import get_last_thursday
+from meritmonitor.logger import get_logger, set_global_log_file, set_log_level, stop_logging
+
+
+class SystemTotals:
+    """Merits and control points by system, of `commander` or of all commanders if None."""
+
+    def __init__(self, commander: str | None = None) -> None:
+        self.commander = commander
+        self.systems: dict[str, list[int]] = {}
+
+    def add_merits(self, system: str, system_state: str, merits: int, control_points: int,
+                   timestamp: int | None = None, commander: str = "", sequence: int = 0) -> bool:
+        if self.commander is not None and commander != self.commander:
+            return False
+        totals = self.systems.get(system)
+        if totals is None:
+            totals = self.systems[system] = [0, 0]
+        totals[0] += merits
+        totals[1] += control_points
+        return True
+
+    def flush(self) -> None:
+        pass
+
+    def rows(self) -> list[tuple[str, int, int]]:
+        return [(system, merits, control_points) for system, (merits, control_points) in sorted(self.systems.items())]
+
+
+def parse_time(value: str) -> datetime:
+    timestamp = datetime.fromisoformat(value.rstrip("Z"))
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def write_json(out, since: datetime, until: datetime | None, totals: SystemTotals) -> None:
+    rows = totals.rows()
+    json.dump({
+        "since": since.isoformat(),
+        "until": until.isoformat() if until else None,
+        "commander": totals.commander,
+        "merits": sum(merits for _, merits, _ in rows),
+        "control_points": sum(control_points for _, _, control_points in rows),
+        "systems": [{"system": system, "merits": merits, "control_points": control_points}
+                    for system, merits, control_points in rows],
+    }, out, ensure_ascii=False, indent=2)
+    out.write("\n")
+
+
+def write_csv(out, since: datetime, until: datetime | None, totals: SystemTotals) -> None:
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(["system", "merits", "control_points"])
+    writer.writerows(totals.rows())
+
+
+WRITERS = {
+    "json": write_json,
+    "csv": write_csv,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m meritmonitor",
+                                     description="Merits and control points by system from Elite Dangerous journals")
+    parser.add_argument("journal_dir")
+    parser.add_argument("--since", type=parse_time, help="UTC, the start of the current PP cycle by default")
+    parser.add_argument("--until", type=parse_time, help="UTC, now by default")
+    parser.add_argument("--commander", help="only merits of this commander")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="json")
+    parser.add_argument("--output", help="write to this file instead of stdout")
+    parser.add_argument("--workers", type=int, default=1, help="processes scanning journal files")
+    parser.add_argument("--scanner", choices=sorted(JOURNAL_SCANNERS), default="lines")
+    parser.add_argument("--profile", metavar="PATH", help="save a cProfile of the load to PATH.prof and PATH.txt")
+    parser.add_argument("--log-file", default=os.devnull)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    set_global_log_file(args.log_file)
+    set_log_level(args.log_level)
+    since = args.since or get_last_thursday()
+    totals = SystemTotals(args.commander)
+    tracker = MeritTracker(totals, journal_dir=args.journal_dir, workers=args.workers, scanner=args.scanner,
+                           logger=get_logger())
+    try:
+        if args.profile:
+            tracker.profile(lambda: tracker.load_merits_since(since, args.until), args.profile)
+        else:
+            tracker.load_merits_since(since, args.until)
+
+        if args.output:
+            with open(args.output, "w", encoding="utf-8", newline="") as out:
+                WRITERS[args.format](out, since, args.until, totals)
+        else:
+            WRITERS[args.format](sys.stdout, since, args.until, totals)
+    finally:
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
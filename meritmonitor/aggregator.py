@@ -0,0 +1,210 @@
+"""
+Squadron aggregator: a standalone HTTP service that merges the merits pushed
+by many pilots' plugins (publisher_mode "aggregator") and posts one report for
+the whole squadron to Discord.
+
+    python -m meritmonitor.aggregator --db squadron.db --port 8765 --webhook-url URL
+
+Plugins POST batches to /merits:
+
+    {"batch": "<unique id>", "deltas": [[week, system, merits, control_points], ...]}
+
+A batch is merged once, sending it again is acknowledged without counting it
+twice. Weeks that changed are published every `interval` seconds through a
+`DiscordPublisher`, which only sends the report chunks that changed.
+"""
+import os
+import json
+import asyncio
+import argparse
+from time import time, perf_counter
+
+from meritmonitor.database import Database
+from meritmonitor.publisher import DiscordPublisher, chunk_report
+from meritmonitor.translations import Translations
+from meritmonitor.logger import get_logger, set_global_log_file, set_log_level, stop_logging
+from meritmonitor.metrics import get_metrics
+
+MAX_BODY_BYTES = 1024 * 1024
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 413: "Payload Too Large"}
+
+
+class AggregatorSettings:
+    """The part of `Settings` the `DiscordPublisher` uses."""
+
+    def __init__(self, webhook_url: str) -> None:
+        self.webhook_url = webhook_url
+
+    def get_webhook_url(self) -> str:
+        return self.webhook_url
+
+
+def parse_batch(body: bytes) -> tuple[str, list[tuple[int, str, int, int]]]:
+    """Batch ID and deltas of a request body, ValueError if it isn't a valid batch."""
+    batch = json.loads(body)
+    batch_id = batch["batch"]
+    if not isinstance(batch_id, str) or not batch_id:
+        raise ValueError("batch must be a non-empty string")
+    deltas = []
+    for week, system, merits, control_points in batch["deltas"]:
+        if not isinstance(system, str):
+            raise ValueError("system must be a string")
+        deltas.append((int(week), system, int(merits), int(control_points)))
+    return batch_id, deltas
+
+
+class Aggregator:
+    def __init__(self, db_path: str, webhook_url: str, translations, interval: float = 60, token: str = "") -> None:
+        self.db_path = db_path
+        self.db = None
+        self.reports_db = None
+        self.translations = translations
+        self.interval = interval
+        self.token = token
+        self.dirty_weeks: set[int] = set()
+        self.publisher = DiscordPublisher(db_path, AggregatorSettings(webhook_url), translations,
+                                          lambda text: get_logger().info("%s", text))
+        self.server = None
+        self.publish_task = None
+
+    async def start(self, host: str, port: int) -> int:
+        """Start serving and publishing, returns the port, useful when `port` is 0."""
+        # The databases are used from the event loop's thread only. Batches are merged on the writer thread,
+        # reports are read from a read-only connection, which sees every merge already awaited without waiting
+        self.db = Database(self.db_path)
+        self.reports_db = Database(self.db_path, read_only=True)
+        self.publisher.start()
+        # Merits merged just before a restart may not have been published yet
+        latest_week = self.db.latest_squadron_week()
+        if latest_week is not None:
+            self.dirty_weeks.add(latest_week)
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        self.publish_task = asyncio.get_running_loop().create_task(self.publish_periodically())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self.publish_task:
+            self.publish_task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        self.publish_dirty_weeks()
+        await asyncio.get_running_loop().run_in_executor(None, self.publisher.stop)
+        self.reports_db.close()
+        self.db.close()
+
+    async def publish_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.publish_dirty_weeks()
+            except Exception as e:
+                get_logger().error("Greška pri objavljivanju izveštaja: %s", e)
+
+    def publish_dirty_weeks(self) -> None:
+        """Hand the report of each week that changed to the publisher thread."""
+        dirty_weeks, self.dirty_weeks = self.dirty_weeks, set()
+        header = f"📊 **{self.translations.translate('Sistemski meriti po sistemima:')}**\n\n"
+        for week in sorted(dirty_weeks):
+            lines = [(system, f"- `{system}`: **{control_points}**\n")
+                     for system, _, control_points in self.reports_db.squadron_merits_by_system(week)]
+            self.publisher.publish(chunk_report(header, lines), week)
+
+    async def route(self, method: str, path: str, headers: dict[str, str], body: bytes) -> tuple[int, dict]:
+        if path == "/health" and method == "GET":
+            return 200, {"ok": True, "dirty_weeks": len(self.dirty_weeks)}
+        if path != "/merits" or method != "POST":
+            return 404, {"error": "not found"}
+        if self.token and headers.get("authorization") != f"Bearer {self.token}":
+            return 401, {"error": "unauthorized"}
+        try:
+            batch_id, deltas = parse_batch(body)
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": str(e)}
+        metrics = get_metrics()
+        # The loop serves other requests while the writer commits, batches merged meanwhile share the commit
+        if not await asyncio.wrap_future(self.db.merge_squadron_batch(batch_id, deltas, time())):
+            metrics.counter("aggregator.duplicate_batches").inc()
+            return 200, {"merged": False}
+        metrics.counter("aggregator.batches").inc()
+        metrics.counter("aggregator.deltas").inc(len(deltas))
+        self.dirty_weeks.update(week for week, _, _, _ in deltas)
+        return 200, {"merged": True}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Minimal HTTP/1.1 with keep-alive, enough for the plugin and the load test."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    status, payload = 413, {"error": "batch too large"}
+                    keep_alive = False
+                else:
+                    started = perf_counter()
+                    body = await reader.readexactly(length)
+                    status, payload = await self.route(method, path, headers, body)
+                    get_metrics().histogram("aggregator.request_seconds").observe(perf_counter() - started)
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            get_logger().debug("Prekinuta veza: %s", e)
+        finally:
+            writer.close()
+
+
+async def serve(args) -> None:
+    translations = Translations(args.lang_dir)
+    translations.load(args.language)
+    aggregator = Aggregator(args.db, args.webhook_url, translations, args.interval, args.token)
+    port = await aggregator.start(args.host, args.port)
+    get_logger().info("Agregator sluša na %s:%d", args.host, port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await aggregator.stop()
+
+
+def main() -> None:
+    default_lang_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lang")
+    parser = argparse.ArgumentParser(description="MeritMonitor squadron aggregator")
+    parser.add_argument("--db", default="squadron.db")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--webhook-url", default=os.environ.get("MERITMONITOR_WEBHOOK_URL", ""))
+    parser.add_argument("--token", default=os.environ.get("MERITMONITOR_AGGREGATOR_TOKEN", ""),
+                        help="require this bearer token from plugins")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between Discord reports")
+    parser.add_argument("--language", default="Srpski")
+    parser.add_argument("--lang-dir", default=default_lang_dir)
+    parser.add_argument("--log-file", default="aggregator.log")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+
+    set_global_log_file(args.log_file)
+    set_log_level(args.log_level)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
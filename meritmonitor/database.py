@@ -1,59 +1,619 @@
-import os
 import sqlite3
+from concurrent.futures import Future
 
 from meritmonitor.logger import get_logger
+from meritmonitor.metrics import timed
+from meritmonitor.storage import connect, acquire_writer, release_writer
+from meritmonitor.fingerprints import fingerprint, TieSequence, MERITS_EVENT
+from meritmonitor.thursday import week_start
+
+# One row per message of a report, a report is split over several messages when it is too long
+CREATE_DISCORD_TABLE = """
+CREATE TABLE IF NOT EXISTS discord (
+    timestamp INTEGER NOT NULL,
+    chunk INTEGER NOT NULL,
+    message_id TEXT NOT NULL,
+    message_hash TEXT NOT NULL,
+    PRIMARY KEY (timestamp, chunk)
+);
+"""
+
+CREATE_MERITS_TABLE = """
+CREATE TABLE IF NOT EXISTS merits (
+    id INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    commander TEXT NOT NULL,
+    system_id INTEGER NOT NULL REFERENCES systems (id),
+    system_state TEXT NOT NULL,
+    merits INTEGER NOT NULL,
+    control_points INTEGER NOT NULL
+);
+"""
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Totals of the merits ledger, kept up to date by insert_merits
+CREATE_ROLLUP_TABLES = """
+CREATE TABLE rollup_daily (
+    week INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    commander TEXT NOT NULL,
+    merits INTEGER NOT NULL,
+    control_points INTEGER NOT NULL,
+    PRIMARY KEY (week, day, commander)
+) WITHOUT ROWID;
+CREATE TABLE rollup_weekly (
+    week INTEGER NOT NULL,
+    commander TEXT NOT NULL,
+    merits INTEGER NOT NULL,
+    control_points INTEGER NOT NULL,
+    PRIMARY KEY (week, commander)
+) WITHOUT ROWID;
+CREATE TABLE rollup_systems (
+    week INTEGER NOT NULL,
+    commander TEXT NOT NULL,
+    system_id INTEGER NOT NULL,
+    merits INTEGER NOT NULL,
+    control_points INTEGER NOT NULL,
+    PRIMARY KEY (week, commander, system_id)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_UPSERTS = {
+    "rollup_daily": "INSERT INTO rollup_daily (week, day, commander, merits, control_points) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (week, day, commander) DO UPDATE SET merits = merits + excluded.merits, "
+                    "control_points = control_points + excluded.control_points",
+    "rollup_weekly": "INSERT INTO rollup_weekly (week, commander, merits, control_points) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT (week, commander) DO UPDATE SET merits = merits + excluded.merits, "
+                     "control_points = control_points + excluded.control_points",
+    "rollup_systems": "INSERT INTO rollup_systems (week, commander, system_id, merits, control_points) "
+                      "VALUES (?, ?, ?, ?, ?) "
+                      "ON CONFLICT (week, commander, system_id) DO UPDATE SET merits = merits + excluded.merits, "
+                      "control_points = control_points + excluded.control_points",
+}
+
+# Rebuild the rollups of merits saved before they existed
+BACKFILL_ROLLUPS = [
+    f"INSERT INTO rollup_daily (week, day, commander, merits, control_points) "
+    f"SELECT week, timestamp / {SECONDS_PER_DAY} * {SECONDS_PER_DAY} AS day, commander, SUM(merits), SUM(control_points) "
+    f"FROM merits GROUP BY week, day, commander",
+    "INSERT INTO rollup_weekly (week, commander, merits, control_points) "
+    "SELECT week, commander, SUM(merits), SUM(control_points) FROM merits GROUP BY week, commander",
+    "INSERT INTO rollup_systems (week, commander, system_id, merits, control_points) "
+    "SELECT week, commander, system_id, SUM(merits), SUM(control_points) FROM merits GROUP BY week, commander, system_id",
+]
+
+# Fingerprints of the merit events in the ledger, see meritmonitor.fingerprints
+CREATE_FINGERPRINTS_TABLE = """
+CREATE TABLE merit_fingerprints (
+    week INTEGER NOT NULL,
+    fingerprint INTEGER NOT NULL,
+    PRIMARY KEY (week, fingerprint)
+) WITHOUT ROWID
+"""
+
+# Goes up in every transaction that changes the ledger, so a snapshot of the totals can tell whether it is current
+CREATE_LEDGER_REVISION_TABLE = """
+CREATE TABLE IF NOT EXISTS ledger_revision (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    revision INTEGER NOT NULL
+)
+"""
+BUMP_LEDGER_REVISION = "UPDATE ledger_revision SET revision = revision + 1"
+
+
+def sum_rollups(rows: list) -> dict[str, list[tuple]]:
+    """Rollup rows adding up ledger `rows`, by rollup table."""
+    daily, weekly, systems = {}, {}, {}
+    for timestamp, week, commander, system_id, _, merits, control_points in rows:
+        for totals, key in ((daily, (week, timestamp // SECONDS_PER_DAY * SECONDS_PER_DAY, commander)),
+                            (weekly, (week, commander)),
+                            (systems, (week, commander, system_id))):
+            total = totals.get(key)
+            totals[key] = (merits, control_points) if total is None else (total[0] + merits, total[1] + control_points)
+    return {
+        table: [key + total for key, total in totals.items()]
+        for table, totals in (("rollup_daily", daily), ("rollup_weekly", weekly), ("rollup_systems", systems))
+    }
+
+
+def execute_statement(conn, statement: str, parameters) -> int:
+    return conn.execute(statement, parameters).rowcount
+
+
+def execute_many(conn, statement: str, rows) -> int:
+    return conn.executemany(statement, rows).rowcount
+
+
+# Tables of the first releases, and of later ones from before the migrations were numbered
+CREATE_TABLES = [
+    CREATE_DISCORD_TABLE,
+    """
+    CREATE TABLE IF NOT EXISTS journal_checkpoints (
+        path TEXT NOT NULL PRIMARY KEY,
+        since INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        offset INTEGER NOT NULL,
+        system TEXT,
+        system_state TEXT,
+        commander TEXT
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS systems (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS journal_index (
+        path TEXT NOT NULL PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        first_timestamp TEXT NOT NULL
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS outbox (
+        timestamp INTEGER NOT NULL PRIMARY KEY,
+        content TEXT NOT NULL,
+        message_hash TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt REAL NOT NULL
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS aggregator_outbox (
+        batch_id TEXT NOT NULL PRIMARY KEY,
+        content TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt REAL NOT NULL
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS aggregator_batches (
+        batch_id TEXT NOT NULL PRIMARY KEY,
+        received REAL NOT NULL
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS squadron_merits (
+        week INTEGER NOT NULL,
+        system TEXT NOT NULL,
+        merits INTEGER NOT NULL,
+        control_points INTEGER NOT NULL,
+        PRIMARY KEY (week, system)
+    ) WITHOUT ROWID""",
+    CREATE_MERITS_TABLE,
+]
+
+
+def create_tables(conn):
+    for statement in CREATE_TABLES:
+        conn.execute(statement)
+
+
+def migrate_table(table: str, column: str, statements: list[str]):
+    """A migration running `statements` if `table` doesn't have `column` yet."""
+    def migration(conn):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            get_logger().info("Ažuriram tabelu %s", table)
+            for statement in statements:
+                conn.execute(statement)
+    return migration
+
+
+def create_rollups(conn):
+    cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollup_weekly'")
+    if cursor.fetchone() is None:
+        get_logger().info("Pravim zbirne tabele merita")
+        for statement in CREATE_ROLLUP_TABLES.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        for statement in BACKFILL_ROLLUPS:
+            conn.execute(statement)
 
-class Database:
-    def __init__(self, db_path):
-        self.db_path = db_path
-        self.conn = None
 
-        if not os.path.exists(self.db_path):
-            self._initialize_database()
+def create_fingerprints(conn):
+    cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'merit_fingerprints'")
+    if cursor.fetchone() is None:
+        get_logger().info("Pravim otiske merita")
+        conn.execute(CREATE_FINGERPRINTS_TABLE)
+        # Merits saved before fingerprints, in the order they were saved
+        ties = TieSequence()
+        cursor = conn.execute("SELECT timestamp, commander, merits FROM merits ORDER BY id")
+        conn.executemany(
+            "INSERT OR IGNORE INTO merit_fingerprints (week, fingerprint) VALUES (?, ?)",
+            ((week_start(timestamp), fingerprint(timestamp, MERITS_EVENT, commander, merits,
+                                                 ties.next(timestamp, commander, merits)))
+             for timestamp, commander, merits in cursor.fetchall()))
 
-        self.conn = sqlite3.connect(self.db_path)
 
-    def _initialize_database(self):
-        """Create the database and tables if the file doesn't exist."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+def create_merits_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS merits_week_commander_system ON merits (week, commander, system_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS merits_timestamp ON merits (timestamp)")
 
-        cursor.execute("""
-        CREATE TABLE discord (
-            timestamp INTEGER NOT NULL PRIMARY KEY,
-            message_id TEXT NOT NULL,
-            message_hash TEXT NOT NULL
-        );
-        """)
 
-        conn.commit()
-        conn.close()
+def create_ledger_revision(conn):
+    conn.execute(CREATE_LEDGER_REVISION_TABLE)
+    conn.execute("INSERT OR IGNORE INTO ledger_revision (id, revision) VALUES (0, 0)")
+
+
+# Schema changes in order, the number of those applied is kept in PRAGMA user_version. Databases
+# from before the numbering start at 0, so every migration must also work on a schema that already has it.
+MIGRATIONS = [
+    create_tables,
+    # Move the one message per week rows of older releases to chunk 0
+    migrate_table("discord", "chunk", [
+        "ALTER TABLE discord RENAME TO discord_single",
+        CREATE_DISCORD_TABLE,
+        "INSERT INTO discord (timestamp, chunk, message_id, message_hash) "
+        "SELECT timestamp, 0, message_id, message_hash FROM discord_single",
+        "DROP TABLE discord_single",
+    ]),
+    # Replace system names in the ledger with IDs from the systems table
+    migrate_table("merits", "system_id", [
+        "INSERT OR IGNORE INTO systems (name) SELECT DISTINCT system FROM merits",
+        "ALTER TABLE merits RENAME TO merits_by_name",
+        CREATE_MERITS_TABLE,
+        "INSERT INTO merits (id, timestamp, week, commander, system_id, system_state, merits, control_points) "
+        "SELECT m.id, m.timestamp, m.week, '', s.id, m.system_state, m.merits, m.control_points "
+        "FROM merits_by_name m JOIN systems s ON s.name = m.system",
+        "DROP TABLE merits_by_name",
+    ]),
+    # Checkpoints without the commander are dropped, so it is read from the start of the journals again
+    migrate_table("journal_checkpoints", "commander", [
+        "ALTER TABLE journal_checkpoints ADD COLUMN commander TEXT",
+        "DELETE FROM journal_checkpoints",
+    ]),
+    create_rollups,
+    create_fingerprints,
+    create_merits_indexes,
+    create_ledger_revision,
+]
+
+
+def migrate(conn):
+    """Run the MIGRATIONS the database doesn't have yet, each in its own transaction."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        get_logger().info("Ažuriram bazu na verziju %d", number)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class Database:
+    """
+    The plugin's database. Queries run on this instance's own read-only
+    connection, writes are queued to the `DatabaseWriter` of the file and
+    committed by it together with the writes of the other threads.
+
+    Writes whose result nobody needs return without waiting for the commit.
+    Every query first waits for the writes queued so far, by any thread, so
+    it sees them. Ledger writes wait, so merits are saved before the journal
+    checkpoints past them. With `read_only` nothing can be written and
+    queries don't wait, for the UI and report queries.
+    """
+
+    def __init__(self, db_path, read_only: bool = False):
+        self.db_path = db_path
+        self.conn = None
+        self.writer = None if read_only else acquire_writer(db_path, migrate)
+        try:
+            self.conn = connect(db_path, read_only=True)
+        except Exception:
+            self.close()
+            raise
 
     def close(self):
         if self.conn:
             self.conn.close()
+            self.conn = None
+        # The last connection to close checkpoints the WAL, which the read-only ones can't do
+        if self.writer:
+            self.writer.wait()
+            release_writer(self.writer)
+            self.writer = None
+
+    def write(self, function, *args) -> Future:
+        """Queue `function(connection, *args)` on the writer, see `DatabaseWriter`."""
+        if self.writer is None:
+            raise sqlite3.OperationalError("the database is opened read-only")
+        return self.writer.submit(function, *args)
 
-    def upsert_discord_message(self, timestamp: int, message_id: str, message_hash: str):
+    def execute(self, statement: str, parameters=()) -> Future:
+        """Queue one statement, its future has the number of rows it changed."""
+        return self.write(execute_statement, statement, parameters)
+
+    def executemany(self, statement: str, rows) -> Future:
+        return self.write(execute_many, statement, rows)
+
+    def query(self, statement: str, parameters=()) -> sqlite3.Cursor:
+        if self.writer:
+            self.writer.wait()
+        return self.conn.execute(statement, parameters)
+
+    @timed("database.upsert_discord_message")
+    def upsert_discord_message(self, timestamp: int, chunk: int, message_id: str, message_hash: str):
         logger = get_logger()
-        logger.info(f"entered upsert_discord_message: {timestamp}, {message_id}, {message_hash}")
-        self.conn.execute(
-            "INSERT OR REPLACE INTO discord (timestamp, message_id, message_hash) VALUES (?, ?, ?)",
-            (timestamp, message_id, message_hash)
+        logger.debug("entered upsert_discord_message: %s, %s, %s, %s", timestamp, chunk, message_id, message_hash)
+        self.execute(
+            "INSERT OR REPLACE INTO discord (timestamp, chunk, message_id, message_hash) VALUES (?, ?, ?, ?)",
+            (timestamp, chunk, message_id, message_hash)
         )
-        self.conn.commit()
 
-    def lookup_discord_message(self, timestamp: int):
+    @timed("database.lookup_discord_messages")
+    def lookup_discord_messages(self, timestamp: int) -> dict[int, tuple[str, str]]:
+        """Message ID and hash of each chunk of the week's report, by chunk index."""
         query = """
-            SELECT message_id, message_hash
+            SELECT chunk, message_id, message_hash
             FROM discord
             WHERE timestamp = ?
-            LIMIT 1
         """
 
-        cursor = self.conn.cursor()
-        cursor.execute(query, (timestamp,))
-        row = cursor.fetchone()
-        if row:
-            return row[0], row[1]
-        else:
-            return None, None
+        cursor = self.query(query, (timestamp,))
+        return {chunk: (message_id, message_hash) for chunk, message_id, message_hash in cursor.fetchall()}
+
+    def delete_discord_message(self, timestamp: int, chunk: int):
+        self.execute("DELETE FROM discord WHERE timestamp = ? AND chunk = ?", (timestamp, chunk))
+
+    @timed("database.lookup_journal_checkpoint")
+    def lookup_journal_checkpoint(self, path: str):
+        cursor = self.query("""
+            SELECT since, size, mtime, offset, system, system_state, commander
+            FROM journal_checkpoints
+            WHERE path = ?
+        """, (path,))
+        return cursor.fetchone()
+
+    @timed("database.save_journal_checkpoints")
+    def save_journal_checkpoints(self, checkpoints: list):
+        self.executemany(
+            "INSERT OR REPLACE INTO journal_checkpoints "
+            "(path, since, size, mtime, offset, system, system_state, commander) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            checkpoints
+        )
+
+    @timed("database.lookup_journal_index")
+    def lookup_journal_index(self, path: str):
+        cursor = self.query("SELECT size, mtime, first_timestamp FROM journal_index WHERE path = ?", (path,))
+        return cursor.fetchone()
+
+    def save_journal_index(self, path: str, size: int, mtime: float, first_timestamp: str):
+        self.execute(
+            "INSERT OR REPLACE INTO journal_index (path, size, mtime, first_timestamp) VALUES (?, ?, ?, ?)",
+            (path, size, mtime, first_timestamp)
+        )
+
+    def delete_journal_checkpoints_except(self, since: int):
+        self.execute("DELETE FROM journal_checkpoints WHERE since != ?", (since,))
+
+    def load_systems(self):
+        return self.query("SELECT id, name FROM systems").fetchall()
+
+    @timed("database.insert_system")
+    def insert_system(self, name: str) -> int:
+        def insert(conn):
+            conn.execute("INSERT OR IGNORE INTO systems (name) VALUES (?)", (name,))
+            return conn.execute("SELECT id FROM systems WHERE name = ?", (name,)).fetchone()[0]
+        return self.write(insert).result()
+
+    @timed("database.insert_merits")
+    def insert_merits(self, rows: list, fingerprints: list = (), outbox_batch: tuple | None = None):
+        """
+        Rows are (timestamp, week, commander, system_id, system_state, merits, control_points),
+        saved in one transaction together with the rollups, the (week, fingerprint) of their events
+        and the (batch_id, content, next_attempt) `outbox_batch` for the aggregator, if any.
+        Returns once they are committed.
+        """
+        def insert(conn):
+            conn.executemany(
+                "INSERT INTO merits (timestamp, week, commander, system_id, system_state, merits, control_points) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            for table, rollup_rows in sum_rollups(rows).items():
+                conn.executemany(ROLLUP_UPSERTS[table], rollup_rows)
+            conn.executemany(
+                "INSERT OR IGNORE INTO merit_fingerprints (week, fingerprint) VALUES (?, ?)",
+                fingerprints
+            )
+            if outbox_batch:
+                conn.execute(
+                    "INSERT INTO aggregator_outbox (batch_id, content, next_attempt) VALUES (?, ?, ?)",
+                    outbox_batch
+                )
+            conn.execute(BUMP_LEDGER_REVISION)
+        self.write(insert).result()
+
+    @timed("database.load_fingerprints")
+    def load_fingerprints(self, week: int) -> list[int]:
+        cursor = self.query("SELECT fingerprint FROM merit_fingerprints WHERE week = ?", (week,))
+        return [row[0] for row in cursor.fetchall()]
+
+    @timed("database.sum_merits_by_system")
+    def sum_merits_by_system(self, week: int):
+        query = """
+            SELECT commander, system_id, merits, control_points
+            FROM rollup_systems
+            WHERE week = ?
+        """
+
+        cursor = self.query(query, (week,))
+        return cursor.fetchall()
+
+    @timed("database.top_systems")
+    def top_systems(self, since_week: int, limit: int, commander: str | None = None):
+        """Systems with the most control points in the weeks from `since_week` on."""
+        query = """
+            SELECT systems.name, SUM(rollup_systems.merits), SUM(rollup_systems.control_points)
+            FROM rollup_systems
+            JOIN systems ON systems.id = rollup_systems.system_id
+            WHERE rollup_systems.week >= ? AND (? IS NULL OR rollup_systems.commander = ?)
+            GROUP BY rollup_systems.system_id
+            ORDER BY SUM(rollup_systems.control_points) DESC, systems.name
+            LIMIT ?
+        """
+
+        cursor = self.query(query, (since_week, commander, commander, limit))
+        return cursor.fetchall()
+
+    @timed("database.merits_by_day")
+    def merits_by_day(self, week: int, commander: str | None = None):
+        query = """
+            SELECT day, SUM(merits), SUM(control_points)
+            FROM rollup_daily
+            WHERE week = ? AND (? IS NULL OR commander = ?)
+            GROUP BY day
+            ORDER BY day
+        """
+
+        cursor = self.query(query, (week, commander, commander))
+        return cursor.fetchall()
+
+    @timed("database.merits_by_week")
+    def merits_by_week(self, since_week: int, commander: str | None = None):
+        query = """
+            SELECT week, SUM(merits), SUM(control_points)
+            FROM rollup_weekly
+            WHERE week >= ? AND (? IS NULL OR commander = ?)
+            GROUP BY week
+            ORDER BY week
+        """
+
+        cursor = self.query(query, (since_week, commander, commander))
+        return cursor.fetchall()
+
+    def ledger_revision(self) -> int:
+        """Number of transactions that changed the ledger, see CREATE_LEDGER_REVISION_TABLE."""
+        cursor = self.query("SELECT revision FROM ledger_revision")
+        return cursor.fetchone()[0]
+
+    def ledger_weeks_before(self, week: int) -> list[int]:
+        """Weeks before `week` that still have rows in the ledger, i.e. were not compacted yet."""
+        cursor = self.query("SELECT DISTINCT week FROM merits WHERE week < ? ORDER BY week", (week,))
+        return [row[0] for row in cursor.fetchall()]
+
+    @timed("database.compact_week")
+    def compact_week(self, week: int) -> int:
+        """
+        Drop the ledger rows of a closed week, its totals stay in the rollups,
+        which were saved together with the rows. The fingerprints of the week
+        are kept for merits that arrive late, those of the weeks before it are
+        dropped. Returns the number of ledger rows dropped.
+        """
+        def compact(conn):
+            deleted = conn.execute("DELETE FROM merits WHERE week = ?", (week,)).rowcount
+            conn.execute("DELETE FROM merit_fingerprints WHERE week < ?", (week,))
+            conn.execute(BUMP_LEDGER_REVISION)
+            return deleted
+        return self.write(compact).result()
+
+    @timed("database.upsert_outbox_message")
+    def upsert_outbox_message(self, timestamp: int, content: str, message_hash: str, next_attempt: float):
+        """Replace the pending report for the week, keeping its retry schedule."""
+        self.execute(
+            "INSERT INTO outbox (timestamp, content, message_hash, next_attempt) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (timestamp) DO UPDATE SET content = excluded.content, message_hash = excluded.message_hash",
+            (timestamp, content, message_hash, next_attempt)
+        )
+
+    @timed("database.due_outbox_messages")
+    def due_outbox_messages(self, now: float):
+        query = """
+            SELECT timestamp, content, message_hash, attempts
+            FROM outbox
+            WHERE next_attempt <= ?
+            ORDER BY timestamp
+        """
+
+        cursor = self.query(query, (now,))
+        return cursor.fetchall()
+
+    def next_outbox_attempt(self) -> float | None:
+        cursor = self.query("SELECT MIN(next_attempt) FROM outbox")
+        return cursor.fetchone()[0]
+
+    @timed("database.reschedule_outbox_message")
+    def reschedule_outbox_message(self, timestamp: int, attempts: int, next_attempt: float):
+        self.execute(
+            "UPDATE outbox SET attempts = ?, next_attempt = ? WHERE timestamp = ?",
+            (attempts, next_attempt, timestamp)
+        )
+
+    def reschedule_outbox(self, next_attempt: float):
+        self.execute("UPDATE outbox SET next_attempt = ?", (next_attempt,))
+
+    @timed("database.delete_outbox_message")
+    def delete_outbox_message(self, timestamp: int, message_hash: str):
+        self.execute(
+            "DELETE FROM outbox WHERE timestamp = ? AND message_hash = ?",
+            (timestamp, message_hash)
+        )
+
+    @timed("database.due_aggregator_batches")
+    def due_aggregator_batches(self, now: float):
+        cursor = self.query("""
+            SELECT batch_id, content, attempts
+            FROM aggregator_outbox
+            WHERE next_attempt <= ?
+            ORDER BY rowid
+        """, (now,))
+        return cursor.fetchall()
+
+    def next_aggregator_attempt(self) -> float | None:
+        cursor = self.query("SELECT MIN(next_attempt) FROM aggregator_outbox")
+        return cursor.fetchone()[0]
+
+    def reschedule_aggregator_batch(self, batch_id: str, attempts: int, next_attempt: float):
+        self.execute(
+            "UPDATE aggregator_outbox SET attempts = ?, next_attempt = ? WHERE batch_id = ?",
+            (attempts, next_attempt, batch_id)
+        )
+
+    def reschedule_aggregator_outbox(self, next_attempt: float):
+        self.execute("UPDATE aggregator_outbox SET next_attempt = ?", (next_attempt,))
+
+    def delete_aggregator_batch(self, batch_id: str):
+        self.execute("DELETE FROM aggregator_outbox WHERE batch_id = ?", (batch_id,))
+
+    @timed("database.merge_squadron_batch")
+    def merge_squadron_batch(self, batch_id: str, deltas: list, received: float) -> Future:
+        """
+        Add the (week, system, merits, control_points) `deltas` of a pilot's batch
+        to the squadron totals. The future is False, nothing changed, if the batch
+        was merged before.
+        """
+        def merge(conn):
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO aggregator_batches (batch_id, received) VALUES (?, ?)",
+                (batch_id, received)
+            )
+            if cursor.rowcount == 0:
+                return False
+            conn.executemany(
+                "INSERT INTO squadron_merits (week, system, merits, control_points) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (week, system) DO UPDATE SET merits = merits + excluded.merits, "
+                "control_points = control_points + excluded.control_points",
+                deltas
+            )
+            return True
+        return self.write(merge)
+
+    def latest_squadron_week(self) -> int | None:
+        cursor = self.query("SELECT MAX(week) FROM squadron_merits")
+        return cursor.fetchone()[0]
+
+    @timed("database.squadron_merits_by_system")
+    def squadron_merits_by_system(self, week: int):
+        cursor = self.query("""
+            SELECT system, merits, control_points
+            FROM squadron_merits
+            WHERE week = ?
+            ORDER BY system
+        """, (week,))
+        return cursor.fetchall()
@@ -0,0 +1,84 @@
+"""
+Fingerprints of the merit events already counted, so the same journal event
+is counted once however often it is seen: by a rescan of the journals, by a
+scan overlapping the live events EDMC queued meanwhile, or by a reload.
+
+A fingerprint is a 64-bit hash of the event's timestamp, name, commander,
+merits and a sequence number that tells apart identical events in the same
+second, kept per PP week in the `merit_fingerprints` table. The system of a
+merit event comes from the jumps before it, which a journal scan and the
+live events EDMC queued meanwhile don't resolve the same way, so it is left
+out. The commander is in every journal and EDMC passes it with each live
+event, so the same event of two commanders is counted for both.
+"""
+import hashlib
+from collections import OrderedDict
+
+MERITS_EVENT = "PowerplayMerits"
+
+
+def fingerprint(timestamp: int, event: str, commander: str, merits: int, sequence: int = 0) -> int:
+    """Signed, so it fits an SQLite INTEGER."""
+    key = f"{timestamp}|{event}|{commander}|{merits}|{sequence}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little", signed=True)
+
+
+class TieSequence:
+    """
+    Sequence numbers of identical events in the same second of one stream of
+    journal events: 0 for the first, 1 for the next identical one and so on.
+    Events are identical if they have the same `key`.
+    """
+
+    def __init__(self) -> None:
+        self.timestamp = None
+        self.counts: dict = {}
+
+    def next(self, timestamp, *key) -> int:
+        if timestamp != self.timestamp:
+            self.timestamp = timestamp
+            self.counts = {}
+        sequence = self.counts.get(key, 0)
+        self.counts[key] = sequence + 1
+        return sequence
+
+
+class FingerprintIndex:
+    """
+    Fingerprints by week. A week is loaded from `db` the first time it is
+    used, and only the `max_weeks` most recently used weeks stay in memory.
+    Fingerprints not saved yet are kept in `pending` until `take_pending`,
+    so a week loaded again still has them.
+    """
+    max_weeks = 3
+
+    def __init__(self, db=None) -> None:
+        self.db = db
+        self.weeks: OrderedDict[int, set[int]] = OrderedDict()
+        self.pending: list[tuple[int, int]] = []
+
+    def week(self, week: int) -> set[int]:
+        fingerprints = self.weeks.get(week)
+        if fingerprints is None:
+            fingerprints = set(self.db.load_fingerprints(week)) if self.db else set()
+            fingerprints.update(pending for pending_week, pending in self.pending if pending_week == week)
+            self.weeks[week] = fingerprints
+            while len(self.weeks) > self.max_weeks:
+                self.weeks.popitem(last=False)
+        else:
+            self.weeks.move_to_end(week)
+        return fingerprints
+
+    def add(self, week: int, event_fingerprint: int) -> bool:
+        """Add a fingerprint, False if the week already has it."""
+        fingerprints = self.week(week)
+        if event_fingerprint in fingerprints:
+            return False
+        fingerprints.add(event_fingerprint)
+        if self.db:
+            self.pending.append((week, event_fingerprint))
+        return True
+
+    def take_pending(self) -> list[tuple[int, int]]:
+        pending, self.pending = self.pending, []
+        return pending
@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+
+from meritmonitor.meritstore import weekly_key
+from meritmonitor.thursday import SECONDS_PER_WEEK
+
+
+def cycles_since(cycles: int, week: int | None = None) -> int:
+    """Key of the first of the last `cycles` PP cycles up to `week`, this week by default."""
+    if week is None:
+        week = weekly_key()
+    return week - (max(1, cycles) - 1) * SECONDS_PER_WEEK
+
+
+def top_systems(db, cycles: int, limit: int = 10, commander: str | None = None) -> list[tuple[str, int, int]]:
+    """(system, merits, control_points) of the systems with the most control points in the last `cycles` cycles."""
+    return db.top_systems(cycles_since(cycles), limit, commander)
+
+
+def merits_per_day(db, week: int | None = None, commander: str | None = None) -> list[tuple[datetime, int, int]]:
+    """(day, merits, control_points) for each day of the cycle with merits, this cycle by default."""
+    if week is None:
+        week = weekly_key()
+    return [(datetime.fromtimestamp(day, tz=timezone.utc), merits, control_points)
+            for day, merits, control_points in db.merits_by_day(week, commander)]
+
+
+def week_over_week(db, cycles: int, commander: str | None = None) -> list[tuple[datetime, int, int, int | None]]:
+    """
+    (week, merits, control_points, merits change from the week before) for the
+    last `cycles` cycles. The change is None when the week before has no merits.
+    """
+    first_week = cycles_since(cycles)
+    totals = {week: (merits, control_points)
+              for week, merits, control_points in db.merits_by_week(first_week - SECONDS_PER_WEEK, commander)}
+    weeks = []
+    for week in range(first_week, weekly_key() + 1, SECONDS_PER_WEEK):
+        merits, control_points = totals.get(week, (0, 0))
+        previous = totals.get(week - SECONDS_PER_WEEK)
+        change = merits - previous[0] if previous else None
+        weeks.append((datetime.fromtimestamp(week, tz=timezone.utc), merits, control_points, change))
+    return weeks
@@ -0,0 +1,296 @@
+import os
+import re
+import mmap
+import sys
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from time import perf_counter
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+from meritmonitor.meritcalculator import control_points_from_merits_gained_batch
+from meritmonitor.logger import get_logger, get_log_level, init_worker_logging, forward_worker_logging
+from meritmonitor.metrics import get_metrics
+from meritmonitor.journalfiles import open_journal, journal_stat, is_compressed
+from meritmonitor.fingerprints import TieSequence
+
+
+# Only these events affect merits, every other journal line is skipped before it is decoded
+RELEVANT_EVENTS = re.compile(rb'"(?:FSDJump|Location|PowerplayMerits|Commander|LoadGame)"')
+EVENT_MARKERS = re.compile(rb'"event": ?"(?:FSDJump|Location|PowerplayMerits|Commander|LoadGame)"')
+MMAP_WINDOW = 16 * 1024 * 1024
+
+
+class JournalScan:
+    """
+    Merits found in a single journal file, independent of the files before it.
+
+    Each event is stored as (timestamp, commander, system, system_state, net_merits).
+    Merits earned before the first Commander/LoadGame or FSDJump/Location (or
+    before the first known PowerplayState) depend on where the previous file
+    left off, so their commander, system or state is None until
+    `apply_journal_scan` resolves them. `commander`, `system` and
+    `system_state` are the last values seen in this file, None if carried over.
+
+    Entries at or after `until` are skipped, unless it is 0.
+    """
+
+    def __init__(self, path: str, since: int, offset: int = 0, system: str | None = None,
+                 system_state: str | None = None, commander: str | None = None, until: int = 0) -> None:
+        self.path = path
+        self.since = since
+        self.until = until
+        self.offset = offset
+        self.commander = commander
+        self.system = system
+        self.system_state = system_state
+        self.size = 0
+        self.mtime = 0.0
+        self.lines = 0
+        self.decoded_lines = 0
+        self.scan_time = 0.0
+        self.events: list[tuple[str, str | None, str | None, str | None, int]] = []
+
+    def process_entry(self, entry: dict) -> None:
+        event = entry.get("event")
+        if event in ["FSDJump", "Location"]:
+            self.system = entry.get("StarSystem", self.system)
+            self.system_state = entry.get("PowerplayState", self.system_state)
+        elif event in ["PowerplayMerits"]:
+            self.events.append((entry["timestamp"], self.commander, self.system, self.system_state,
+                                entry.get("MeritsGained") or 0))
+        elif event in ["Commander"]:
+            self.commander = entry.get("Name", self.commander)
+        elif event in ["LoadGame"]:
+            self.commander = entry.get("Commander", self.commander)
+
+
+def format_timestamp(timestamp: int) -> str:
+    """Journal timestamps are fixed width, so they can be compared as strings."""
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_timestamp(timestamp: str) -> int:
+    return int(datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp())
+
+
+def process_line(scan: JournalScan, line: bytes, since: str, until: str, logger) -> None:
+    scan.decoded_lines += 1
+    try:
+        entry = json_loads(line)
+        if entry["timestamp"] < since or (until and entry["timestamp"] >= until):
+            return
+        scan.process_entry(entry)
+    except Exception as e:
+        logger.error("Greška u liniji fajla %s: %s", scan.path, e)
+
+
+def scan_journal_lines(scan: JournalScan) -> JournalScan:
+    """Read complete lines from `scan.offset` onwards, skipping entries older than `scan.since`."""
+    logger = get_logger()
+    started = perf_counter()
+    since = format_timestamp(scan.since)
+    until = format_timestamp(scan.until) if scan.until else ""
+    relevant = RELEVANT_EVENTS.search
+    with open_journal(scan.path) as f:
+        f.seek(scan.offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # The game is still writing this line, pick it up on the next scan
+                break
+            scan.offset += len(line)
+            scan.lines += 1
+            if relevant(line):
+                process_line(scan, line, since, until, logger)
+    scan.scan_time = perf_counter() - started
+    return scan
+
+
+def scan_journal_mmap(scan: JournalScan) -> JournalScan:
+    """
+    Same as `scan_journal_lines`, but maps the file in windows of `MMAP_WINDOW`
+    bytes and jumps between event markers, so only the matching lines are
+    copied out of the file. Lines are not counted. Compressed journals can't
+    be mapped and are read line by line.
+    """
+    if is_compressed(scan.path):
+        return scan_journal_lines(scan)
+    logger = get_logger()
+    started = perf_counter()
+    since = format_timestamp(scan.since)
+    until = format_timestamp(scan.until) if scan.until else ""
+    find_events = EVENT_MARKERS.finditer
+    with open(scan.path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        position = scan.offset
+        while position < size:
+            window_start = position - position % mmap.ALLOCATIONGRANULARITY
+            length = min(MMAP_WINDOW, size - window_start)
+            with mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ, offset=window_start) as window:
+                start = position - window_start
+                # Lines after the last newline are incomplete or continue in the next window
+                end = window.rfind(b"\n", start) + 1
+                if end == 0:
+                    break
+                line_end = start
+                for marker in find_events(window, start, end):
+                    if marker.start() < line_end:
+                        continue
+                    line_start = window.rfind(b"\n", start, marker.start()) + 1 or start
+                    line_end = window.find(b"\n", marker.end(), end) + 1
+                    process_line(scan, window[line_start:line_end], since, until, logger)
+                position = window_start + end
+        scan.offset = position
+    scan.scan_time = perf_counter() - started
+    return scan
+
+
+JOURNAL_SCANNERS = {
+    "lines": scan_journal_lines,
+    "mmap": scan_journal_mmap,
+}
+
+
+def scan_journal(scan: JournalScan, scanner: str = "lines") -> JournalScan:
+    return JOURNAL_SCANNERS.get(scanner, scan_journal_lines)(scan)
+
+
+def restore_journal_scan(db, path: str, since: int, stat: os.stat_result, until: int = 0) -> tuple[JournalScan, bool]:
+    """
+    Rebuild the position in a journal file from the checkpoint saved in `db`.
+    Returns the scan and whether the file has to be read (again) from `scan.offset`.
+    Scans that end at `until` are not checkpointed, so they always start from the beginning.
+    """
+    checkpoint = db.lookup_journal_checkpoint(path) if db and not until else None
+    if checkpoint:
+        checkpoint_since, size, mtime, offset, system, system_state, commander = checkpoint
+        if checkpoint_since == since and stat.st_size >= size:
+            scan = JournalScan(path, since, offset, system, system_state, commander)
+            scan.size, scan.mtime = size, mtime
+            return scan, stat.st_size != size or stat.st_mtime != mtime
+    return JournalScan(path, since, until=until), True
+
+
+def scan_journals_in_parallel(scans: list[JournalScan], workers: int, scanner: str) -> list[JournalScan | None]:
+    """Scan files in a process pool, None in place of files that failed."""
+    results = []
+    log_queue = multiprocessing.Queue()
+    log_listener = forward_worker_logging(log_queue)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_logging,
+                                 initargs=(log_queue, get_log_level())) as pool:
+            futures = [pool.submit(scan_journal, scan, scanner) for scan in scans]
+            for scan, future in zip(scans, futures):
+                try:
+                    results.append(future.result())
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    get_logger().error("Greška pri otvaranju fajla %s: %s", scan.path, e)
+                    results.append(None)
+    finally:
+        log_listener.stop()
+        log_queue.close()
+    return results
+
+
+def scan_journals_in_sequence(scans: list[JournalScan], scanner: str) -> list[JournalScan | None]:
+    results = []
+    for scan in scans:
+        try:
+            results.append(scan_journal(scan, scanner))
+        except Exception as e:
+            get_logger().error("Greška pri otvaranju fajla %s: %s", scan.path, e)
+            results.append(None)
+    return results
+
+
+def scan_journals(db, paths: list[str], since: int, workers: int = 1, scanner: str = "lines",
+                  until: int = 0) -> list[JournalScan]:
+    """
+    Scan journal files from the checkpoints saved in `db` with one of the
+    `JOURNAL_SCANNERS`, in a process pool if `workers` > 1. Returns scans in the order of `paths`, ready for
+    `apply_journal_scan`; files that could not be read are left out.
+    Unchanged files are returned without events so the carried over system
+    and state stay correct. Without `db` every file is scanned from the start.
+    """
+    logger = get_logger()
+    scans = []
+    changed = []
+    for path in paths:
+        try:
+            stat = journal_stat(path)
+            scan, needs_scan = restore_journal_scan(db, path, since, stat, until)
+        except Exception as e:
+            logger.error("Greška pri otvaranju fajla %s: %s", path, e)
+            continue
+        scans.append(scan)
+        if needs_scan:
+            changed.append((len(scans) - 1, stat))
+
+    to_scan = [scans[index] for index, _ in changed]
+    results = None
+    if workers > 1 and len(to_scan) > 1:
+        if getattr(sys, "frozen", False):
+            # A frozen EDMC executable can not be used to spawn worker processes
+            logger.info("Paralelno učitavanje nije dostupno, učitavam redom")
+        else:
+            try:
+                results = scan_journals_in_parallel(to_scan, workers, scanner)
+            except (BrokenProcessPool, OSError) as e:
+                logger.error("Greška u paralelnom učitavanju, učitavam redom: %s", e)
+    if results is None:
+        results = scan_journals_in_sequence(to_scan, scanner)
+
+    metrics = get_metrics()
+    metrics.counter("journal.files_unchanged").inc(len(scans) - len(changed))
+    for (index, stat), scan in zip(changed, results):
+        if scan is not None:
+            scan.size, scan.mtime = stat.st_size, stat.st_mtime
+            metrics.counter("journal.files_scanned").inc()
+            metrics.counter("journal.lines").inc(scan.lines)
+            metrics.counter("journal.decoded_lines").inc(scan.decoded_lines)
+            metrics.histogram("journal.scan_file_seconds").observe(scan.scan_time)
+        scans[index] = scan
+    return [scan for scan in scans if scan is not None]
+
+
+def save_journal_checkpoints(db, scans: list[JournalScan]) -> None:
+    """Call once the merits of `scans` are saved, so a crash in between can't lose them."""
+    db.save_journal_checkpoints([(scan.path, scan.since, scan.size, scan.mtime, scan.offset,
+                                  scan.system, scan.system_state, scan.commander) for scan in scans])
+
+
+def apply_journal_scan(scan: JournalScan, merit_store, commander: str, system: str,
+                       system_state: str) -> tuple[str, str, str]:
+    """
+    Add the merits of `scan` to `merit_store`, resolving the commander, system
+    and state of early merits with the ones carried over from the previous file.
+    Events the store has already counted are skipped by it, so a scan can be applied again.
+    Returns the commander, system and state to carry over to the next file.
+
+    The events are split into columns, so the control points of the whole
+    file are calculated in one batch.
+    """
+    if scan.events:
+        timestamps, commanders, systems, system_states, net_merits = zip(*scan.events)
+        commanders = [commander if value is None else value for value in commanders]
+        systems = [system if value is None else value for value in systems]
+        system_states = [system_state if value is None else value for value in system_states]
+        control_points = control_points_from_merits_gained_batch(system_states, net_merits)
+        ties = TieSequence()
+        for timestamp, event_commander, event_system, event_state, merits, points in zip(
+                timestamps, commanders, systems, system_states, net_merits, control_points):
+            merit_store.add_merits(event_system, event_state, merits, points, parse_timestamp(timestamp),
+                                   event_commander, ties.next(timestamp, event_commander, merits))
+
+    return (commander if scan.commander is None else scan.commander,
+            system if scan.system is None else scan.system,
+            system_state if scan.system_state is None else scan.system_state)
@@ -0,0 +1,137 @@
+import os
+import bz2
+import glob
+import gzip
+import lzma
+import json
+import zipfile
+from datetime import datetime, timezone
+
+from meritmonitor.logger import get_logger
+from meritmonitor.metrics import get_metrics
+
+JOURNAL_PATTERNS = ["Journal.*.log", "Journal.*.log.gz", "Journal.*.log.bz2", "Journal.*.log.xz", "Journal.*.zip"]
+COMPRESSED_OPENERS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+# Journals inside a zip archive are addressed as "<archive>::<member>"
+ZIP_MEMBER_SEPARATOR = "::"
+
+
+def split_zip_member(path: str) -> tuple[str, str | None]:
+    if ZIP_MEMBER_SEPARATOR in path:
+        archive, member = path.rsplit(ZIP_MEMBER_SEPARATOR, 1)
+        return archive, member
+    return path, None
+
+
+def is_compressed(path: str) -> bool:
+    archive, member = split_zip_member(path)
+    return member is not None or os.path.splitext(archive)[1] in COMPRESSED_OPENERS
+
+
+def journal_stat(path: str) -> os.stat_result:
+    """Stat of the journal file, or of the archive it is in."""
+    return os.stat(split_zip_member(path)[0])
+
+
+def open_journal(path: str):
+    """Open a plain or compressed journal as a binary stream, decompressing while it is read."""
+    archive, member = split_zip_member(path)
+    if member is not None:
+        # The member stream keeps the archive file open until it is closed itself
+        with zipfile.ZipFile(archive) as zip_file:
+            return zip_file.open(member)
+    opener = COMPRESSED_OPENERS.get(os.path.splitext(archive)[1], open)
+    return opener(archive, "rb")
+
+
+def read_first_timestamp(path: str) -> str | None:
+    """Timestamp of the first entry (the Fileheader), None for an empty journal."""
+    with open_journal(path) as f:
+        line = f.readline()
+    if not line.endswith(b"\n"):
+        return None
+    return json.loads(line)["timestamp"]
+
+
+def journal_name(path: str) -> str:
+    """File name of the journal without the archive or compression suffix."""
+    archive, member = split_zip_member(path)
+    name = os.path.basename(member if member is not None else archive)
+    stem, extension = os.path.splitext(name)
+    return stem if extension in COMPRESSED_OPENERS else name
+
+
+def list_journals(journal_dir: str) -> list[str]:
+    """
+    Plain, compressed and zipped journals in `journal_dir`. A journal that is
+    both archived and still present as a plain file is listed once, preferring
+    the plain file.
+    """
+    paths = {}
+    for pattern in JOURNAL_PATTERNS:
+        for path in sorted(glob.glob(os.path.join(journal_dir, pattern))):
+            if not path.endswith(".zip"):
+                paths.setdefault(journal_name(path), path)
+                continue
+            try:
+                with zipfile.ZipFile(path) as zip_file:
+                    for member in zip_file.namelist():
+                        name = os.path.basename(member)
+                        if name.startswith("Journal.") and name.endswith(".log"):
+                            paths.setdefault(name, f"{path}{ZIP_MEMBER_SEPARATOR}{member}")
+            except (OSError, zipfile.BadZipFile) as e:
+                get_logger().error("Greška pri otvaranju arhive %s: %s", path, e)
+    return list(paths.values())
+
+
+def journal_first_timestamp(db, path: str) -> str:
+    """
+    First timestamp of a journal from the index in `db`, read from the file
+    (decompressing only its first line) if the file changed since it was indexed.
+    Journals without a complete first line fall back to the file's mtime.
+    Without `db` the first line is always read.
+    """
+    stat = journal_stat(path)
+    indexed = db.lookup_journal_index(path) if db else None
+    if indexed:
+        size, mtime, first_timestamp = indexed
+        if size == stat.st_size and mtime == stat.st_mtime:
+            return first_timestamp
+    get_metrics().counter("journal.files_indexed").inc()
+    first_timestamp = read_first_timestamp(path)
+    if first_timestamp is None:
+        return datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    if db:
+        db.save_journal_index(path, stat.st_size, stat.st_mtime, first_timestamp)
+    return first_timestamp
+
+
+def find_journals(db, journal_dir: str, since: str, until: str | None = None) -> list[str]:
+    """
+    Plain and archived journals that can have entries at or after `since`,
+    and before `until` if it is given, ordered by their first timestamp. A
+    journal ends where the next one starts, so journals followed by one that
+    starts before `since` are skipped.
+    """
+    logger = get_logger()
+    journals = []
+    for path in list_journals(journal_dir):
+        try:
+            journals.append((journal_first_timestamp(db, path), path))
+        except Exception as e:
+            logger.error("Greška pri otvaranju fajla %s: %s", path, e)
+    journals.sort()
+
+    paths = []
+    for index, (first_timestamp, path) in enumerate(journals):
+        next_starts = journals[index + 1][0] if index + 1 < len(journals) else None
+        if next_starts is not None and next_starts <= since:
+            continue
+        if until is not None and first_timestamp >= until:
+            break
+        paths.append(path)
+    return paths
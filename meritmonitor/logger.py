@@ -1,7 +1,15 @@
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
 
 # Global log file path (can be changed before any logger is created)
 _global_log_file = "meritmonitor.log"
+_global_log_level = logging.INFO
+_listeners = []
+
+LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR"]
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
 
 def set_global_log_file(path: str):
     """
@@ -11,26 +19,77 @@ def set_global_log_file(path: str):
     global _global_log_file
     _global_log_file = path
 
+def get_global_log_file() -> str:
+    return _global_log_file
+
+def set_log_level(level: str):
+    """Set the level of all loggers, records below it are dropped before they are formatted."""
+    global _global_log_level
+    _global_log_level = logging.getLevelName(level) if level in LOG_LEVELS else logging.INFO
+    for name in logging.root.manager.loggerDict:
+        logger = logging.getLogger(name)
+        if any(isinstance(handler, QueueHandler) for handler in logger.handlers):
+            logger.setLevel(_global_log_level)
+
+def get_log_level() -> int:
+    return _global_log_level
+
+def init_worker_logging(queue, level: int):
+    """
+    Pool initializer of worker processes: their records go to `queue`, which
+    `forward_worker_logging` hands to the loggers of the parent process, so
+    only the parent writes (and rotates) the log file.
+    """
+    global _global_log_level
+    _global_log_level = level
+    logger = logging.getLogger("MeritMonitor")
+    # A forked worker inherits the parent's handlers, whose listener threads it doesn't have
+    logger.handlers.clear()
+    logger.setLevel(level)
+    logger.addHandler(QueueHandler(queue))
+    logger.propagate = False
+
+class ForwardingHandler(logging.Handler):
+    def emit(self, record):
+        get_logger(record.name).handle(record)
+
+def forward_worker_logging(queue) -> QueueListener:
+    """Start passing records of worker processes from `queue` to the loggers of this process, stop it when done."""
+    listener = QueueListener(queue, ForwardingHandler())
+    listener.start()
+    return listener
+
+def stop_logging():
+    """Write out queued records and stop the listener threads."""
+    while _listeners:
+        _listeners.pop().stop()
+
 def get_logger(name: str = "MeritMonitor") -> logging.Logger:
     logger = logging.getLogger(name)
 
     if not logger.handlers:
-        logger.setLevel(logging.DEBUG)
+        logger.setLevel(_global_log_level)
 
         formatter = logging.Formatter(
             '%(asctime)s [%(levelname)s] %(name)s: %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
 
-        # File handler using global log file
-        file_handler = logging.FileHandler(_global_log_file, encoding='utf-8')
+        # Rotating file handler using global log file
+        file_handler = RotatingFileHandler(_global_log_file, maxBytes=LOG_FILE_MAX_BYTES,
+                                           backupCount=LOG_FILE_BACKUPS, encoding='utf-8')
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
 
         # Optional: console handler
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+
+        # Records are formatted and written by the listener thread, off the calling thread
+        queue = SimpleQueue()
+        listener = QueueListener(queue, file_handler, console_handler)
+        listener.start()
+        _listeners.append(listener)
+        logger.addHandler(QueueHandler(queue))
 
         logger.propagate = False
 
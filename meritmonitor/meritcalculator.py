@@ -6,10 +6,79 @@ state_table = {
     "Controlled": 0.65
 }
 
-def control_points_from_merits_gained(system_state: str, net_merits: int) -> int:
-    multiplier = state_table.get(system_state, 1.0)
+# Net merits below this have their control points looked up instead of calculated
+CONTROL_POINTS_TABLE_SIZE = 4096
+
 
+def calculate_control_points(multiplier: float, net_merits: int) -> int:
     gross_merits = round(net_merits / multiplier)
     system_control_points = round(gross_merits * 0.25)
 
     return system_control_points
+
+
+class ControlPointTables(dict):
+    """
+    Control points by system state, each a list indexed by net merits from 0
+    to CONTROL_POINTS_TABLE_SIZE - 1. A state's table is built the first time
+    the state is used, states with the same multiplier share one table.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.by_multiplier: dict[float, list[int]] = {}
+
+    def __missing__(self, system_state: str) -> list[int]:
+        multiplier = state_table.get(system_state, 1.0)
+        table = self.by_multiplier.get(multiplier)
+        if table is None:
+            table = self.by_multiplier[multiplier] = [calculate_control_points(multiplier, net_merits)
+                                                      for net_merits in range(CONTROL_POINTS_TABLE_SIZE)]
+        self[system_state] = table
+        return table
+
+
+control_point_tables = ControlPointTables()
+
+
+def control_points_from_merits_gained(system_state: str, net_merits: int) -> int:
+    if net_merits.__class__ is int and 0 <= net_merits < CONTROL_POINTS_TABLE_SIZE:
+        return control_point_tables[system_state][net_merits]
+    return calculate_control_points(state_table.get(system_state, 1.0), net_merits)
+
+
+def control_points_from_merits_gained_batch(system_states, net_merits) -> list[int]:
+    """
+    Control points of many events given as columns, the same as
+    `control_points_from_merits_gained` of each state and net merits pair.
+    Net merits already in a NumPy array are calculated with NumPy, lists go
+    through the lookup tables, which is faster than converting them. NumPy
+    is only imported by whoever made the array, it takes longer to import
+    than the rest of the plugin.
+    """
+    if type(net_merits).__module__ == "numpy":
+        return control_points_numpy(system_states, net_merits)
+    return control_points_python(system_states, net_merits)
+
+
+def control_points_python(system_states, net_merits) -> list[int]:
+    tables = control_point_tables
+    get_multiplier = state_table.get
+    return [tables[system_state][merits]
+            if merits.__class__ is int and 0 <= merits < CONTROL_POINTS_TABLE_SIZE
+            else calculate_control_points(get_multiplier(system_state, 1.0), merits)
+            for system_state, merits in zip(system_states, net_merits)]
+
+
+def control_points_numpy(system_states, net_merits) -> list[int]:
+    """
+    Float64 division and numpy.rint, which rounds halves to even like
+    `round`, give the same results as the scalar calculation.
+    """
+    import numpy
+    get_multiplier = state_table.get
+    count = len(net_merits)
+    multipliers = numpy.fromiter((get_multiplier(system_state, 1.0) for system_state in system_states),
+                                 numpy.float64, count)
+    gross_merits = numpy.rint(numpy.asarray(net_merits, dtype=numpy.float64) / multipliers)
+    return numpy.rint(gross_merits * 0.25).astype(numpy.int64).tolist()
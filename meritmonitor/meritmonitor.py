@@ -1,41 +1,53 @@
-import glob
 import os
-import json
-from datetime import datetime, timedelta, timezone
-import hashlib
-from time import sleep
+from time import monotonic, perf_counter, time
 
 from queue import Queue, Empty
-from threading import Thread, Event
+from threading import Thread, Event, Lock
 
 import tkinter as tk
-from tkinter import StringVar, Toplevel, Text
+from tkinter import StringVar, Toplevel, Text, ttk
 
-import requests
 import myNotebook as nb
 from semantic_version import Version
 
 from config import get_config # from EDMC
 
-from meritmonitor.meritcalculator import control_points_from_merits_gained
-from meritmonitor.meritstore import MeritStore
+from meritmonitor.meritstore import MeritStore, UNKNOWN_COMMANDER
 from meritmonitor.settings import Settings
 from meritmonitor.translations import Translations
 from meritmonitor.database import Database
-from meritmonitor.thursday import get_last_thursday
-from meritmonitor.logger import get_logger, set_global_log_file
-
-
-class MeritMonitor:
+from meritmonitor.publisher import DiscordPublisher, AggregatorPublisher, hash_message, chunk_report
+from meritmonitor.tracker import MeritTracker
+from meritmonitor.logger import get_logger, set_global_log_file, set_log_level, stop_logging, LOG_LEVELS
+from meritmonitor.metrics import get_metrics, timed
+from meritmonitor.history import top_systems, merits_per_day, week_over_week
+from meritmonitor.snapshot import save_snapshot, load_snapshot
+from meritmonitor.thursday import SECONDS_PER_WEEK
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# PP cycles shown in the history tab of the report preview
+HISTORY_TOP_CYCLES = 4
+HISTORY_WEEKS = 8
+# Milliseconds between checks of the Tk thread for a new status from the other threads
+UI_POLL_MS = 1000
+# Seconds a status message is shown before the live totals are shown again
+STATUS_SECONDS = 5
+# Seconds between snapshots of the merit totals, they are also saved at shutdown
+SNAPSHOT_INTERVAL = 300
+# Seconds past the end of a PP cycle before it is rolled over, for its last merits still on the way
+ROLLOVER_DELAY = 60
+
+
+class MeritMonitor(MeritTracker):
     webhook_entry = None
     settings = Settings("")
     lang_var = StringVar(value=settings.get_language())
+    log_level_var = StringVar(value=settings.get_log_level())
+    report_commander_var = StringVar(value=settings.get_report_commander())
     webhook_entry_var = StringVar(value=settings.get_webhook_url())
 
     personal_total = 0
     merit_store = MeritStore()
-    last_seen_system = "Nepoznato"
-    last_seen_system_state = "Unoccupied"
     last_frame = None
     status_text = StringVar(value="Status: učitavanje...")
     plugin_dir = None
@@ -43,21 +55,41 @@ class MeritMonitor:
     translations = None
     db = None
     root = None
-    last_discord_update = datetime.now()
-    notified_of_missing_webhook = False
+    # Latest live totals and status message for the Tk thread, the message is shown until
+    # status_until and whether the Tk thread hasn't picked up a change yet
+    live_status_text = None
+    status_message = None
+    status_until = 0.0
+    ui_update_scheduled = False
+    ui_poll_id = None
+    publisher = None
+    # (week, language, store version) of the cached report and of the last published one
+    report = (None, [], "")
+    published_report_key = None
+    # Snapshot restored at startup, until the worker has checked it against the ledger
+    snapshot = None
+    started = 0.0
+    first_total_shown = False
+    last_snapshot = 0.0
+    snapshot_version = None
+    # Unix time of the next PP cycle rollover, see roll_over_closed_weeks
+    next_rollover = 0
 
     def __init__(self, plugin_name: str, version: Version) -> None:
+        super().__init__()
         self.plugin_name: str = plugin_name
         self.version: Version = version
 
         self.journal_queue: Queue = Queue()
-        self.ui_update_queue: Queue = Queue()
+        self.metrics = get_metrics()
+        self.ui_lock = Lock()
         self.should_run: Event = Event()
         self.should_run.set()
         self.worker_thread = Thread(target=self.worker, name='MeritMonitor worker')
         self.worker_thread.daemon = True
 
     def plugin_start(self, plugin_dir: str) -> None:
+        self.started = perf_counter()
         self.plugin_dir = plugin_dir
         self.translations = Translations(os.path.join(plugin_dir, "lang"))
         self.init_files(plugin_dir)
@@ -66,23 +98,62 @@ class MeritMonitor:
         try:
             self.settings = Settings(self.settings_file)
             self.lang_var.set(self.settings.get_language())
+            self.log_level_var.set(self.settings.get_log_level())
+            set_log_level(self.settings.get_log_level())
             self.webhook_entry_var.set(self.settings.get_webhook_url())
 
             self.translations.load(self.settings.get_language())
+            self.restore_snapshot()
+
+            publisher_class = AggregatorPublisher if self.settings.get_publisher_mode() == "aggregator" else DiscordPublisher
+            self.publisher = publisher_class(os.path.join(plugin_dir, "merits.db"), self.settings,
+                                             self.translations, self.set_status_text)
+            self.publisher.start()
 
             self.logger.info("Pokrećem I/O nit")
             try:
                 self.worker_thread.start()
             except RuntimeError as re:
-                self.logger.critical(f"Greška pri pokretanju I/O niti: {re}")
+                self.logger.critical("Greška pri pokretanju I/O niti: %s", re)
 
             self.logger.info("Plugin MeritMonitor pokrenut")
         except Exception as e:
-            self.logger.error(f"Greška pri pokretanju plugina: {e}")
+            self.logger.error("Greška pri pokretanju plugina: %s", e)
 
     def init_files(self, plugin_dir: str) -> None:
         self.log_file = os.path.join(plugin_dir, "meritmonitor.log")
         self.settings_file = os.path.join(plugin_dir, "settings.json")
+        self.snapshot_file = os.path.join(plugin_dir, "snapshot.json")
+
+    def restore_snapshot(self) -> None:
+        """Show the totals of the last snapshot until the worker has loaded the ledger and the journals."""
+        self.snapshot = load_snapshot(self.snapshot_file)
+        if self.snapshot is None:
+            return
+        merit_store = MeritStore()
+        try:
+            if not merit_store.restore_snapshot(self.snapshot):
+                self.logger.info("Snimak merita je iz prethodnog PP ciklusa")
+                self.snapshot = None
+                return
+            commander, system, system_state = self.snapshot["journal"]
+        except (KeyError, TypeError, ValueError) as e:
+            self.logger.error("Neispravan snimak merita: %s", e)
+            self.snapshot = None
+            return
+        self.merit_store = merit_store
+        self.last_seen_commander, self.last_seen_system, self.last_seen_system_state = commander, system, system_state
+        self.update_live_status()
+        self.record_first_total()
+
+    def record_first_total(self) -> None:
+        """Time-to-first-total: from `plugin_start` until the status first shows totals."""
+        if self.first_total_shown:
+            return
+        self.first_total_shown = True
+        seconds = perf_counter() - self.started
+        self.metrics.gauge("startup.first_total_seconds").set(seconds)
+        self.logger.info("Prvi zbir merita posle %.1f ms", seconds * 1000)
 
     def get_journal_dir(self) -> str:
         self.logger.info("Trying to get custom journal directory from EDMC")
@@ -93,73 +164,32 @@ class MeritMonitor:
                 self.logger.info("Trying to get default journal directory from EDMC")
                 journal_dir = get_config().default_journal_dir
         except Exception as e:
-            self.logger.error(f"exception getting journal_dir: {repr(e)} [{e}]")
+            self.logger.error("exception getting journal_dir: %r [%s]", e, e)
 
         if isinstance(journal_dir, str) and os.path.isdir(journal_dir):
-            self.logger.info(f"Using EDMC journal directory: {journal_dir}")
+            self.logger.info("Using EDMC journal directory: %s", journal_dir)
         else:
             user_dir = os.environ.get('USERPROFILE')
             if user_dir is None:
                 self.logger.critical("Unable to find journal directory!")
                 return ""
             journal_dir = os.path.join(user_dir, "Saved Games", "Frontier Developments", "Elite Dangerous")
-            self.logger.info(f"Falling back to default journal directory: {journal_dir}")
+            self.logger.info("Falling back to default journal directory: %s", journal_dir)
         return journal_dir
 
-    def load_merits_since(self, timestamp):
-        self.merit_store = MeritStore()
-        journal_dir = os.path.expanduser(self.get_journal_dir())
-
-        for filename in sorted(glob.glob(os.path.join(journal_dir, "Journal.*.log"))):
-            try:
-                if filename.endswith('.lnk'):
-                    continue
-                mtime = datetime.fromtimestamp(os.path.getmtime(filename), tz=timezone.utc)
-                if mtime < timestamp:
-                    continue
-                #self.logger.info(f"Processing journal: {filename}")
-                with open(filename, "r", encoding="utf-8") as f:
-                    for line in f:
-                        try:
-                            entry = json.loads(line)
-                            ts = datetime.strptime(entry["timestamp"], "%Y-%m-%dT%H:%M:%SZ")
-                            if ts < timestamp:
-                                continue
-                            self.process_journal_entry(entry, None)
-                        except Exception as e:
-                            self.logger.error(f"Greška u liniji fajla {filename}: {e}")
-            except Exception as e:
-                self.logger.error(f"Greška pri otvaranju fajla {filename}: {e}")
-        self.update_live_status()
-
-    def load_today_merits(self):
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        self.load_merits_since(today)
-
-    def load_full_pp_cycle(self):
-        thursday = get_last_thursday()
-        self.load_merits_since(thursday)
-
-    def process_journal_entry(self, entry, system=None):
-        event = entry.get("event")
-        if event in ["FSDJump", "Location"]:
-            self.last_seen_system = entry.get("StarSystem", self.last_seen_system or "Nepoznato")
-            self.last_seen_system_state = entry.get("PowerplayState", self.last_seen_system_state)
-        elif event in ["PowerplayMerits"]:
-            net_merits_gained = entry.get("MeritsGained") or 0
-
-            system_control_points_gained = control_points_from_merits_gained(self.last_seen_system_state, net_merits_gained)
+    def get_journal_workers(self) -> int:
+        return self.settings.get_journal_workers()
 
-            self.merit_store.add_personal(self.last_seen_system, net_merits_gained)
-            self.merit_store.add_control_points(self.last_seen_system, system_control_points_gained)
-            self.logger.info(f"Dodato: {net_merits_gained} merita za {self.last_seen_system} ({self.last_seen_system_state})")
+    def get_journal_scanner(self) -> str:
+        return self.settings.get_journal_scanner()
 
     def journal_entry(self, cmdr, is_beta, system, station, entry, state):
-        self.journal_queue.put((system, entry))
+        self.journal_queue.put((monotonic(), cmdr, system, entry))
 
     def get_plugin_frame(self, parent):
         self.root = parent.winfo_toplevel()
-        self.schedule_next_ui_update()
+        if self.ui_poll_id is None:
+            self.poll_ui_update()
         frame = tk.Frame(parent)
         self.last_frame = frame
         return self.populate_plugin_frame(frame)
@@ -175,6 +205,8 @@ class MeritMonitor:
         button_frame.pack(pady=5)
         tk.Button(button_frame, text=self.translations.translate("Prikaži izveštaj"), compound="left",
                    command=self.show_preview_modal).pack(side="left", padx=5)
+        tk.Button(button_frame, text=self.translations.translate("Dijagnostika"), compound="left",
+                   command=self.show_diagnostics_modal).pack(side="left", padx=5)
 
         tk.Label(frame, textvariable=self.status_text).pack()
 
@@ -199,14 +231,36 @@ class MeritMonitor:
         self.webhook_entry = nb.EntryMenu(frame, width=40, textvariable=self.webhook_entry_var)
         self.webhook_entry.grid(row=current_row, column=1)
 
+        current_row += 1
+        nb.Label(frame, text=self.translations.translate("Nivo logovanja") + ": ").grid(row=current_row, sticky="w")
+        log_level_menu = nb.OptionMenu(frame, self.log_level_var, self.settings.get_log_level(), *LOG_LEVELS)
+        log_level_menu.grid(row=current_row, column=1, sticky="w")
+
+        current_row += 1
+        all_commanders = self.translations.translate("Svi komandanti")
+        self.report_commander_var.set(self.settings.get_report_commander() or all_commanders)
+        nb.Label(frame, text=self.translations.translate("Komandant u izveštaju") + ": ").grid(row=current_row, sticky="w")
+        commanders = [commander for commander in self.merit_store.commanders() if commander != UNKNOWN_COMMANDER]
+        commander_menu = nb.OptionMenu(frame, self.report_commander_var, self.report_commander_var.get(),
+                                       all_commanders, *commanders)
+        commander_menu.grid(row=current_row, column=1, sticky="w")
+
         return frame
 
     def on_webhook_entry_change(self, *args):
         self.settings.set_webhook_url(self.webhook_entry_var.get())
-        self.notified_of_missing_webhook = False
+        if self.publisher:
+            self.publisher.notified_of_missing_webhook = False
+            self.publisher.retry()
 
     def on_preferences_closed(self, cmdr, is_beta):
         self.settings.set_language(self.lang_var.get())
+        self.settings.set_log_level(self.log_level_var.get())
+        set_log_level(self.settings.get_log_level())
+        report_commander = self.report_commander_var.get()
+        if report_commander == self.translations.translate("Svi komandanti"):
+            report_commander = ""
+        self.settings.set_report_commander(report_commander)
         self.on_webhook_entry_change()
         self.settings.save_settings(self.settings_file)
 
@@ -222,135 +276,334 @@ class MeritMonitor:
         win = Toplevel()
         win.title(self.translations.translate("Pregled Discord izveštaja"))
         win.geometry("500x500")
-        txt = Text(win, wrap="word", height=15)
+        tabs = ttk.Notebook(win)
+        txt = Text(tabs, wrap="word", height=15)
         txt.insert("1.0", text)
         txt.config(state="disabled")
+        tabs.add(txt, text=self.translations.translate("Izveštaj"))
+        history = Text(tabs, wrap="none", height=15)
+        history.insert("1.0", self.render_history_text())
+        history.config(state="disabled")
+        tabs.add(history, text=self.translations.translate("Istorija"))
+        tabs.pack(padx=10, pady=10, fill="both", expand=True)
+        tk.Button(win, text=self.translations.translate("Otkaži"), command=win.destroy).pack(side="right", padx=10, pady=5)
+
+    @timed("ui.render_history_seconds")
+    def render_history_text(self) -> str:
+        """History from the rollups in the database, on a read-only connection of the calling (UI) thread."""
+        translate = self.translations.translate
+        commander = self.report_commander()
+        try:
+            db = Database(os.path.join(self.plugin_dir, "merits.db"), read_only=True)
+        except Exception as e:
+            self.logger.error("Greška pri otvaranju baze: %s", e)
+            return ""
+        try:
+            lines = [f"{translate('Najbolji sistemi u poslednjih')} {HISTORY_TOP_CYCLES} {translate('ciklusa')}:"]
+            for index, (system, merits, control_points) in enumerate(top_systems(db, HISTORY_TOP_CYCLES, 10, commander)):
+                lines.append(f"  {index + 1}. {system}: {control_points} ({merits} {translate('ličnih')})")
+
+            lines += ["", f"{translate('Meriti po danu ovog ciklusa')}:"]
+            for day, merits, control_points in merits_per_day(db, commander=commander):
+                lines.append(f"  {day:%Y-%m-%d}: {merits} / {control_points}")
+
+            lines += ["", f"{translate('Promena iz nedelje u nedelju')}:"]
+            for week, merits, control_points, change in week_over_week(db, HISTORY_WEEKS, commander):
+                change_text = "" if change is None else f" ({change:+d})"
+                lines.append(f"  {week:%Y-%m-%d}: {merits}{change_text} / {control_points}")
+            return "\n".join(lines)
+        except Exception as e:
+            self.logger.error("Greška pri čitanju istorije: %s", e)
+            return ""
+        finally:
+            db.close()
+
+    def show_diagnostics_modal(self):
+        win = Toplevel()
+        win.title(self.translations.translate("Dijagnostika"))
+        win.geometry("600x500")
+        txt = Text(win, wrap="none", height=15)
         txt.pack(padx=10, pady=10, fill="both", expand=True)
+
+        def refresh():
+            txt.config(state="normal")
+            txt.delete("1.0", "end")
+            txt.insert("1.0", self.render_diagnostics_text())
+            txt.config(state="disabled")
+
+        profile_var = tk.BooleanVar(win, value=self.settings.get_profile_startup())
+        tk.Checkbutton(win, text=self.translations.translate("Profiliši učitavanje pri pokretanju"), variable=profile_var,
+                       command=lambda: self.settings.set_profile_startup(profile_var.get())).pack(anchor="w", padx=10)
         tk.Button(win, text=self.translations.translate("Otkaži"), command=win.destroy).pack(side="right", padx=10, pady=5)
+        tk.Button(win, text=self.translations.translate("Izvezi JSON"), command=self.export_metrics).pack(side="right", padx=10, pady=5)
+        tk.Button(win, text=self.translations.translate("Osveži"), command=refresh).pack(side="right", padx=10, pady=5)
+        refresh()
+
+    def render_diagnostics_text(self) -> str:
+        lines = []
+        for name, value in self.metrics.snapshot().items():
+            if isinstance(value, dict):
+                lines.append(f"{name}: n={value['count']} avg={value['mean']:.4g} "
+                             f"min={value['min'] or 0:.4g} max={value['max'] or 0:.4g}")
+            else:
+                lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+    def export_metrics(self):
+        path = os.path.join(self.plugin_dir, "meritmonitor-metrics.json")
+        try:
+            self.metrics.export_json(path)
+            self.set_status_text(f"{self.translations.translate('Metrike sačuvane:')} {path}")
+        except OSError as e:
+            self.logger.error("Greška pri čuvanju metrika: %s", e)
+
+    def report_commander(self) -> str | None:
+        """Commander whose merits go in the report, None for all commanders."""
+        return self.settings.get_report_commander() or None
+
+    def report_key(self, week: int | None = None) -> tuple[int, str, str | None, int]:
+        return (week or self.merit_store.week_key(), self.translations.language, self.report_commander(),
+                self.merit_store.version)
+
+    def generate_report(self, week: int | None = None) -> tuple[list[str], str]:
+        """
+        Report chunks and their hash for `week`, this week by default, rendered
+        again only once the merits or the language change.
+        """
+        key = self.report_key(week)
+        cached_key, chunks, message_hash = self.report
+        if cached_key == key:
+            return chunks, message_hash
+        header = f"📊 **{self.translations.translate('Sistemski meriti po sistemima:')}**\n\n"
+        chunks = chunk_report(header, self.merit_store.get_control_points_by_system_lines(self.report_commander(),
+                                                                                          key[0]))
+        message_hash = hash_message("".join(chunks))
+        self.report = (key, chunks, message_hash)
+        return chunks, message_hash
 
     def generate_report_text(self) -> str:
-        text = f"📊 **{self.translations.translate('Sistemski meriti po sistemima:')}**\n\n"
-        text += self.merit_store.get_control_points_by_system_report()
-        return text
+        return "".join(self.generate_report()[0])
 
     def render_live_status_text(self):
-        total_p = self.merit_store.sum_personal()
-        total_s = self.merit_store.sum_system()
+        total_p = self.merit_store.sum_personal(self.last_seen_commander)
+        total_s = self.merit_store.sum_system(self.last_seen_commander)
         live = self.translations.translate("Uživo")
         merits = self.translations.translate("ličnih")
         control_points = self.translations.translate("sistemskih merita")
         return f"{live}: {total_p} {merits} / {total_s} {control_points}."
 
     def update_live_status(self):
-        self.set_status_text(self.render_live_status_text())
-
-    def hash_message(self, text: str) -> str:
-        h = hashlib.new('sha256')
-        byte_array = text.encode('utf-8')
-        h.update(byte_array)
-        return h.hexdigest()
-
-    def post_to_discord(self, text: str):
-        webhook_url = self.settings.get_webhook_url()
-        if not webhook_url and not self.notified_of_missing_webhook:
-            self.set_status_text(self.translations.translate("Webhook URL nije podešen."))
-            self.notified_of_missing_webhook = True
-            return
-
-        thursday = get_last_thursday()
-        timestamp = int(thursday.timestamp())
-
-        message_hash = self.hash_message(text)
-
-        message_id, existing_message_hash = self.db.lookup_discord_message(timestamp)
-
-        payload = {"content": text}
-        headers = {'Content-Type': 'application/json'}
-
-        try:
-            if message_id:
-                self.logger.info("Našao prethodnu Discord poruku u bazi.")
-                if existing_message_hash == message_hash:
-                    self.logger.info("Nema promena od poslednje Discord poruke.")
-                    return
-                else:
-                    self.logger.info("Аžuriram prethodnu Discord poruku.")
-                    url = f"{webhook_url}/messages/{message_id}"
-                    response = requests.patch(url, json=payload, headers=headers)
-            else:
-                self.logger.info("Šaljem novu Discord poruku")
-                response = requests.post(f"{webhook_url}?wait=true", json=payload, headers=headers)
-            response.raise_for_status()
-
-        except requests.RequestException as e:
-            error_message = self.translations.translate("Greška pri slanju:")
-            self.set_status_text(f"{error_message} {e}")
-
-        self.logger.info(response)
-        res_json = response.json()
-        new_message_id = res_json.get("id")
-        self.db.upsert_discord_message(timestamp, new_message_id, message_hash)
-        status_text = "Discord poruka ažurirana." if message_id else "Uspešno poslato na Discord."
-        self.set_status_text(self.translations.translate(status_text))
+        """Hand the live totals to the Tk thread, shown whenever there is no status message."""
+        new_text = self.render_live_status_text()
+        with self.ui_lock:
+            if new_text == self.live_status_text:
+                return
+            self.live_status_text = new_text
+            self.schedule_ui_update()
 
     def shut_down(self):
+        # Tk is going away, stop checking for status updates
+        root, self.root = self.root, None
+        if root and self.ui_poll_id is not None:
+            root.after_cancel(self.ui_poll_id)
+            self.ui_poll_id = None
         self.should_run.clear()
         self.worker_thread.join(timeout=10)
+        if self.publisher:
+            self.publisher.stop()
+        stop_logging()
 
     def worker(self):
         self.logger.info("Inicijalizujem sqlite3 ...")
         self.db = Database(os.path.join(self.plugin_dir, "merits.db"))
+        outbox_batch = self.aggregator_batch if isinstance(self.publisher, AggregatorPublisher) else None
+        merit_store = MeritStore(self.db, outbox_batch)
+        snapshot, self.snapshot = self.snapshot, None
+        if snapshot and snapshot["ledger_until"] == self.db.ledger_revision():
+            merit_store.system_ids.load()
+            merit_store.restore_snapshot(snapshot)
+        else:
+            if snapshot:
+                self.logger.info("Snimak merita se ne slaže sa bazom, učitavam iz baze")
+            merit_store.load()
+        self.merit_store = merit_store
+        self.update_live_status()
+        self.record_first_total()
         self.logger.info("Učitavam poslednji PP ciklus ...")
-        self.set_status_text("Učitavam poslednji PP ciklus ...")
-        self.load_full_pp_cycle()
+        if not snapshot:
+            self.set_status_text("Učitavam poslednji PP ciklus ...")
+        if self.settings.get_profile_startup():
+            self.profile(self.load_full_pp_cycle, os.path.join(self.plugin_dir, "meritmonitor-startup"))
+        else:
+            self.load_full_pp_cycle()
         self.logger.info("Poslednji PP ciklus učitan.")
-        self.set_status_text("Poslednji PP ciklus učitan.")
+        if not snapshot:
+            self.set_status_text("Poslednji PP ciklus učitan.")
+        self.roll_over_closed_weeks()
+        self.save_snapshot()
         self.background_discord_update()
         self.logger.info("Glavna petlja I/O niti")
         while self.should_run.is_set():
-            entry = None
-            system = None
-
             try:
-                system, entry = self.journal_queue.get(block=True, timeout=2)
+                self.process_journal_batch()
             except Empty:
-                pass
+                self.merit_store.flush()
+            if time() >= self.next_rollover:
+                self.roll_over_closed_weeks()
+                self.save_snapshot()
+            if monotonic() - self.last_snapshot >= SNAPSHOT_INTERVAL:
+                self.save_snapshot()
+        self.save_snapshot()
+        self.db.close()
+
+    @timed("rollover.seconds")
+    def roll_over_closed_weeks(self) -> None:
+        """
+        Close the PP cycles that have ended: publish the final report of the
+        cycle that just ended, compact the ledger rows of every closed cycle
+        and drop their totals from memory, then schedule the next rollover
+        for ROLLOVER_DELAY seconds after the current cycle ends.
+
+        Also catches up at startup on cycles that ended while the plugin was
+        not running, a closed cycle still has ledger rows until it is compacted.
+        """
+        this_week = self.merit_store.week_key()
+        try:
+            self.merit_store.flush()
+            closed_weeks = self.db.ledger_weeks_before(this_week)
+            closing_week = this_week - SECONDS_PER_WEEK
+            if closing_week in closed_weeks:
+                self.publish_final_report(closing_week)
+            for week in closed_weeks:
+                deleted = self.db.compact_week(week)
+                self.logger.info("PP ciklus %s zatvoren, sažeto %d redova merita", week, deleted)
+                self.metrics.counter("rollover.weeks").inc()
+            self.merit_store.evict_weeks_before(this_week)
+            self.update_live_status()
+        except Exception as e:
+            self.logger.error("Greška pri zatvaranju PP ciklusa: %s", e)
+        finally:
+            self.next_rollover = this_week + SECONDS_PER_WEEK + ROLLOVER_DELAY
+
+    def publish_final_report(self, week: int) -> None:
+        """Publish the report of a closed PP cycle with all its merits, loading its totals if they are not in memory."""
+        if not self.merit_store.has_week(week):
+            self.merit_store.load(week)
+        if self.merit_store.sum_system(self.report_commander(), week) == 0:
+            return
+        self.logger.info("Šaljem završni izveštaj PP ciklusa %s", week)
+        chunks, message_hash = self.generate_report(week)
+        self.publisher.publish(chunks, week, message_hash)
+
+    def save_snapshot(self) -> None:
+        """Flush the merits and snapshot the totals, unless nothing changed since the last snapshot."""
+        self.merit_store.flush()
+        self.last_snapshot = monotonic()
+        if self.merit_store.version == self.snapshot_version:
+            return
+        try:
+            save_snapshot(self.snapshot_file, self.merit_store, self.db.ledger_revision(),
+                          self.last_seen_commander, self.last_seen_system, self.last_seen_system_state)
+            self.snapshot_version = self.merit_store.version
+        except OSError as e:
+            self.logger.error("Greška pri čuvanju snimka merita: %s", e)
+
+    def aggregator_batch(self, rows):
+        """The aggregator outbox batch of ledger rows about to be saved, see `AggregatorPublisher.outbox_batch`."""
+        names = self.merit_store.system_ids.names
+        return self.publisher.outbox_batch([(week, names[system_id], merits, control_points)
+                                            for _, week, _, system_id, _, merits, control_points in rows])
+
+    def process_journal_batch(self):
+        """
+        Process queued journal entries until the queue is empty, the batch is
+        full or its time budget is spent, then update the status and the
+        Discord report once for the whole batch.
+        """
+        queued_at, cmdr, system, entry = self.journal_queue.get(block=True, timeout=2)
+        started = monotonic()
+        self.metrics.gauge("queue.journal").set(self.journal_queue.qsize() + 1)
+        entry_seconds = self.metrics.histogram("journal.process_entry_seconds")
+        oldest_queued_at = queued_at
+        batch_size = self.settings.get_worker_batch_size()
+        time_budget = self.settings.get_worker_batch_time_ms() / 1000
+        merits_changed = False
+        processed = 0
+        while True:
+            entry_started = perf_counter()
+            try:
+                merits_changed = self.process_journal_entry(entry, system, cmdr) or merits_changed
+            except Exception as e:
+                self.logger.error("Greška u journal_entry: %s", e)
+            entry_seconds.observe(perf_counter() - entry_started)
+            processed += 1
+            if processed >= batch_size or monotonic() - started >= time_budget:
+                break
+            try:
+                queued_at, cmdr, system, entry = self.journal_queue.get_nowait()
+            except Empty:
+                break
 
-            if entry:
-                try:
-                    self.process_journal_entry(entry, system)
-                    self.update_live_status()
-                    self.background_discord_update()
-                except Exception as e:
-                    self.logger.error(f"Greška u journal_entry: {e}")
+        try:
+            self.update_live_status()
+            if merits_changed:
+                self.background_discord_update()
+        except Exception as e:
+            self.logger.error("Greška u journal_entry: %s", e)
 
-    def set_status_text(self, new_text: str):
-        self.ui_update_queue.put(new_text)
+        self.metrics.histogram("worker.batch_size", BATCH_SIZE_BUCKETS).observe(processed)
+        self.metrics.histogram("worker.batch_seconds").observe(monotonic() - started)
+        self.metrics.histogram("worker.batch_latency_seconds").observe(monotonic() - oldest_queued_at)
 
-    def delay_discord_update(self):
-        delay_seconds = 1
-        if datetime.now() - self.last_discord_update >= timedelta(seconds=delay_seconds):
-            sleep(delay_seconds)
+    def set_status_text(self, new_text: str):
+        """
+        Hand the status message `new_text` to the Tk thread, from any thread.
+        It is shown for STATUS_SECONDS, then the live totals again. The Tk
+        thread picks up only the latest text, see `poll_ui_update`. No Tk
+        calls are made here: from another thread they wait for the Tk thread,
+        which may be gone or itself waiting for that thread at shutdown.
+        """
+        with self.ui_lock:
+            self.status_message = new_text
+            self.status_until = monotonic() + STATUS_SECONDS
+            self.schedule_ui_update()
+
+    def schedule_ui_update(self):
+        """Mark a change for the Tk thread, with `ui_lock` held."""
+        if self.ui_update_scheduled:
+            self.metrics.counter("ui.coalesced_updates").inc()
+        self.ui_update_scheduled = True
 
     def background_discord_update(self):
-        if self.merit_store.sum_system() == 0:
-            self.logger.info("Nothing to send to Discord")
+        if self.merit_store.sum_system(self.report_commander()) == 0:
+            self.logger.debug("Nothing to send to Discord")
             return
-        self.logger.info("Discord update")
-        self.delay_discord_update()
-        discord_message = self.generate_report_text()
-        self.post_to_discord(discord_message)
-
-    def consume_ui_update_queue(self):
-        try:
-            msg = self.ui_update_queue.get_nowait()
-            self.status_text.set(msg)
-        except Empty:
-            self.update_live_status()
-        self.schedule_next_ui_update()
-
-    def schedule_next_ui_update(self):
-        if self.root:
-            self.root.after(5000, self.consume_ui_update_queue)
-        else:
-            self.logger.error(f"No root widget")
+        report_key = self.report_key()
+        if report_key == self.published_report_key:
+            self.logger.debug("Nema promena od poslednjeg izveštaja")
+            return
+        self.logger.debug("Discord update")
+        chunks, message_hash = self.generate_report()
+        self.publisher.publish(chunks, report_key[0], message_hash)
+        self.published_report_key = report_key
+
+    def poll_ui_update(self):
+        """Show the latest status every UI_POLL_MS on the Tk thread, until shutdown."""
+        root = self.root
+        if root is None:
+            return
+        self.consume_ui_update()
+        self.ui_poll_id = root.after(UI_POLL_MS, self.poll_ui_update)
+
+    def consume_ui_update(self):
+        with self.ui_lock:
+            if self.status_message is not None and monotonic() >= self.status_until:
+                self.status_message = None
+                self.ui_update_scheduled = True
+            if not self.ui_update_scheduled:
+                return
+            self.ui_update_scheduled = False
+            new_text = self.status_message if self.status_message is not None else self.live_status_text
+        if new_text is not None and new_text != self.status_text.get():
+            self.status_text.set(new_text)
+            self.metrics.counter("ui.updates").inc()
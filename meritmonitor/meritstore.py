@@ -1,44 +1,257 @@
-from meritmonitor.thursday import get_last_thursday
+from array import array
+from bisect import insort
+from time import monotonic, time
+
+from meritmonitor.thursday import get_last_thursday, get_next_thursday, week_start
+from meritmonitor.fingerprints import FingerprintIndex, fingerprint, MERITS_EVENT
+from meritmonitor.metrics import get_metrics
+
+# Commander of merits from before the first Commander or LoadGame event
+UNKNOWN_COMMANDER = ""
 
 
 def weekly_key() -> int:
     return int(get_last_thursday().timestamp())
 
 
+class SystemIds:
+    """
+    System names interned as small integer IDs. With a database the IDs come
+    from its `systems` table, so the ledger stores the same IDs.
+    """
+
+    def __init__(self, db=None) -> None:
+        self.db = db
+        self.ids: dict[str, int] = {}
+        self.names: list[str] = [""]
+
+    def load(self) -> None:
+        if not self.db:
+            return
+        for system_id, name in self.db.load_systems():
+            self.register(system_id, name)
+
+    def register(self, system_id: int, name: str) -> None:
+        if system_id >= len(self.names):
+            self.names.extend([""] * (system_id + 1 - len(self.names)))
+        self.names[system_id] = name
+        self.ids[name] = system_id
+
+    def get_id(self, name: str) -> int:
+        system_id = self.ids.get(name)
+        if system_id is None:
+            system_id = self.db.insert_system(name) if self.db else len(self.names)
+            self.register(system_id, name)
+        return system_id
+
+    def name(self, system_id: int) -> str:
+        return self.names[system_id]
+
+
+class WeekMerits:
+    """
+    Merits of one PP cycle by system, with running totals. Counters are
+    arrays indexed in the order systems showed up in the week, and
+    `sorted_systems` keeps the system IDs sorted by name.
+    """
+    __slots__ = ("slots", "system_merits", "system_control_points", "sorted_systems", "merits", "control_points")
+
+    def __init__(self) -> None:
+        self.slots: dict[int, int] = {}
+        self.system_merits = array("q")
+        self.system_control_points = array("q")
+        self.sorted_systems: list[int] = []
+        self.merits = 0
+        self.control_points = 0
+
+    def add(self, system_id: int, merits: int, control_points: int, names: list[str]) -> None:
+        slot = self.slots.get(system_id)
+        if slot is None:
+            slot = self.slots[system_id] = len(self.system_merits)
+            self.system_merits.append(0)
+            self.system_control_points.append(0)
+            insort(self.sorted_systems, system_id, key=names.__getitem__)
+        self.system_merits[slot] += merits
+        self.system_control_points[slot] += control_points
+        self.merits += merits
+        self.control_points += control_points
+
+    def control_points_of(self, system_id: int) -> int:
+        return self.system_control_points[self.slots[system_id]]
+
+
 class MeritStore:
-    live_personal_by_system = {}
-    live_control_points_by_system = {}
+    """
+    Merits by commander, week and system, backed by the `merits` ledger in the database.
+
+    Each week is kept per commander and, under the None commander, for all
+    commanders together. Systems are kept as IDs from `system_ids`.
+
+    New merits are kept in memory and written to the ledger in batches by
+    `flush`, which also runs once `batch_size` merits are waiting or
+    `flush_interval` seconds have passed since the last write.
+
+    `version` goes up with every change, so anything derived from the merits
+    can be cached until it does. `outbox_batch` turns the ledger rows of each
+    flush into an aggregator outbox batch, saved in the same transaction.
+
+    Merits with a timestamp are counted once per event: an event already in
+    `fingerprints` is skipped, so journal rescans and live events can overlap.
+    They go to the week of their timestamp, not of the time they arrive, and
+    merits of weeks before `closed_before` (rolled over by `evict_weeks_before`)
+    only go to the ledger.
+    """
+    batch_size = 500
+    flush_interval = 10
+
+    def __init__(self, db=None, outbox_batch=None) -> None:
+        self.db = db
+        self.outbox_batch = outbox_batch
+        self.system_ids = SystemIds(db)
+        self.fingerprints = FingerprintIndex(db)
+        self.weeks: dict[tuple[str | None, int], WeekMerits] = {}
+        self.unsaved_merits = []
+        self.last_flush = monotonic()
+        self.this_week = 0
+        self.next_week_starts = 0.0
+        self.closed_before = 0
+        self.version = 0
+        self.system_reports: dict[tuple[str | None, int], tuple[int, list[tuple[str, str]]]] = {}
+
+    def week_key(self) -> int:
+        """Key of the current week, recomputed only once the next Thursday 07:00 UTC has passed."""
+        if time() >= self.next_week_starts:
+            self.this_week = weekly_key()
+            self.next_week_starts = get_next_thursday().timestamp()
+        return self.this_week
+
+    def week(self, week: int | None = None, commander: str | None = None) -> WeekMerits:
+        """Merits of `commander` in `week`, of all commanders if `commander` is None."""
+        if week is None:
+            week = self.week_key()
+        week_merits = self.weeks.get((commander, week))
+        if week_merits is None:
+            week_merits = self.weeks[(commander, week)] = WeekMerits()
+        return week_merits
+
+    def commanders(self, week: int | None = None) -> list[str]:
+        """Commanders with merits in `week`, this week by default."""
+        if week is None:
+            week = self.week_key()
+        return sorted(commander for commander, key in list(self.weeks) if key == week and commander is not None)
+
+    def load(self, week: int | None = None) -> None:
+        """Rebuild the totals of `week`, this week by default, from the ledger."""
+        if not self.db:
+            return
+        self.system_ids.load()
+        if week is None:
+            week = self.week_key()
+        names = self.system_ids.names
+        everyone = self.week(week)
+        for commander, system_id, merits, control_points in self.db.sum_merits_by_system(week):
+            self.week(week, commander).add(system_id, merits, control_points, names)
+            everyone.add(system_id, merits, control_points, names)
+        self.version += 1
+
+    def has_week(self, week: int) -> bool:
+        return (None, week) in self.weeks
+
+    def evict_weeks_before(self, week: int) -> None:
+        """Drop the totals of the weeks before `week` from memory, their later merits only go to the ledger."""
+        self.flush()
+        for key in [key for key in list(self.weeks) if key[1] < week]:
+            del self.weeks[key]
+        self.system_reports = {key: report for key, report in self.system_reports.items() if key[1] >= week}
+        self.closed_before = max(self.closed_before, week)
+        self.version += 1
 
-    def add_personal(self, system: str, amount: int):
-        this_week = weekly_key()
-        self.live_personal_by_system.setdefault(this_week, {}).setdefault(system, 0)
+    def to_snapshot(self) -> dict:
+        """This week's totals as plain lists, see `restore_snapshot`."""
+        this_week = self.week_key()
+        weeks = []
+        for (commander, week), week_merits in list(self.weeks.items()):
+            if week != this_week:
+                continue
+            system_ids = list(week_merits.slots)
+            weeks.append([commander, week, system_ids,
+                          [week_merits.system_merits[week_merits.slots[system_id]] for system_id in system_ids],
+                          [week_merits.control_points_of(system_id) for system_id in system_ids]])
+        return {"week": this_week, "systems": list(self.system_ids.names), "weeks": weeks}
 
-        self.live_personal_by_system[this_week][system] += amount
+    def restore_snapshot(self, snapshot: dict) -> bool:
+        """Rebuild this week's totals from a `to_snapshot`, False if the snapshot is from another week."""
+        this_week = self.week_key()
+        if snapshot["week"] != this_week:
+            return False
+        for system_id, name in enumerate(snapshot["systems"]):
+            if name:
+                self.system_ids.register(system_id, name)
+        names = self.system_ids.names
+        for commander, week, system_ids, merits, control_points in snapshot["weeks"]:
+            week_merits = self.week(week, commander)
+            for system_id, system_merits, system_control_points in zip(system_ids, merits, control_points):
+                week_merits.add(system_id, system_merits, system_control_points, names)
+        self.version += 1
+        return True
 
-    def add_control_points(self, system:str, amount: int):
-        this_week = weekly_key()
-        self.live_control_points_by_system.setdefault(this_week, {}).setdefault(system, 0)
+    def flush(self) -> None:
+        self.last_flush = monotonic()
+        if not self.db or not self.unsaved_merits:
+            return
+        unsaved_merits, self.unsaved_merits = self.unsaved_merits, []
+        outbox_batch = self.outbox_batch(unsaved_merits) if self.outbox_batch else None
+        self.db.insert_merits(unsaved_merits, self.fingerprints.take_pending(), outbox_batch)
 
-        self.live_control_points_by_system[this_week][system] += amount
+    def add_merits(self, system: str, system_state: str, merits: int, control_points: int,
+                   timestamp: int | None = None, commander: str = UNKNOWN_COMMANDER, sequence: int = 0) -> bool:
+        """
+        Add the merits of one event, False if the event was already counted.
+        `sequence` tells apart identical events in the same second, see `TieSequence`.
+        """
+        if timestamp is not None and not self.fingerprints.add(
+                week_start(timestamp), fingerprint(timestamp, MERITS_EVENT, commander, merits, sequence)):
+            get_metrics().counter("merits.duplicates").inc()
+            return False
+        week = week_start(timestamp) if timestamp is not None else self.week_key()
+        system_id = self.system_ids.get_id(system)
+        if week >= self.closed_before:
+            names = self.system_ids.names
+            self.week(week, commander).add(system_id, merits, control_points, names)
+            self.week(week).add(system_id, merits, control_points, names)
+            self.version += 1
 
-    def sum_personal(self) -> int:
-        this_week = weekly_key()
-        self.live_personal_by_system.setdefault(this_week, {})
+        if self.db:
+            if timestamp is None:
+                timestamp = int(time())
+            self.unsaved_merits.append((timestamp, week, commander, system_id, system_state, merits, control_points))
+            if len(self.unsaved_merits) >= self.batch_size or monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+        return True
 
-        return sum(self.live_personal_by_system[this_week].values())
+    def sum_personal(self, commander: str | None = None, week: int | None = None) -> int:
+        return self.week(week, commander).merits
 
-    def sum_system(self) -> int:
-        this_week = weekly_key()
-        self.live_control_points_by_system.setdefault(this_week, {})
+    def sum_system(self, commander: str | None = None, week: int | None = None) -> int:
+        return self.week(week, commander).control_points
 
-        return sum(self.live_control_points_by_system[this_week].values())
+    def get_control_points_by_system_lines(self, commander: str | None = None,
+                                           week: int | None = None) -> list[tuple[str, str]]:
+        """
+        Report line of each system sorted by system, for `commander` or for
+        all commanders if None, in `week` or this week if None.
+        """
+        if week is None:
+            week = self.week_key()
+        cached = self.system_reports.get((commander, week))
+        if cached and cached[0] == self.version:
+            return cached[1]
+        week_merits = self.week(week, commander)
+        names = self.system_ids.names
+        lines = [(names[system_id], f"- `{names[system_id]}`: **{week_merits.control_points_of(system_id)}**\n")
+                 for system_id in week_merits.sorted_systems]
+        self.system_reports[(commander, week)] = (self.version, lines)
+        return lines
 
-    def get_control_points_by_system_report(self) -> str:
-        this_week = weekly_key()
-        self.live_control_points_by_system.setdefault(this_week, {})
-        control_points_by_system = self.live_control_points_by_system[this_week]
-        text = ""
-        for system in sorted(control_points_by_system):
-            s = control_points_by_system[system]
-            text += f"- `{system}`: **{s}**\n"
-        return text
+    def get_control_points_by_system_report(self, commander: str | None = None, week: int | None = None) -> str:
+        return "".join([line for _, line in self.get_control_points_by_system_lines(commander, week)])
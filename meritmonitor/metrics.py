@@ -0,0 +1,125 @@
+import json
+import functools
+from threading import Lock
+from time import perf_counter
+
+# Upper bounds of histogram buckets, in seconds unless a histogram sets its own
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+
+class Counter:
+    __slots__ = ("value", "lock")
+
+    def __init__(self) -> None:
+        self.value = 0
+        self.lock = Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def snapshot(self) -> int:
+        return self.value
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def set(self, value) -> None:
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "total", "min", "max", "lock")
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.lock = Lock()
+
+    def observe(self, value: float) -> None:
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None or value < self.min else self.min
+            self.max = value if self.max is None or value > self.max else self.max
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+            return {
+                "count": self.count,
+                "sum": self.total,
+                "mean": self.total / self.count if self.count else 0.0,
+                "min": self.min,
+                "max": self.max,
+                "buckets": dict(zip(bounds, self.counts)),
+            }
+
+
+class Metrics:
+    """Named counters, gauges and histograms, created on first use."""
+
+    def __init__(self) -> None:
+        self.metrics = {}
+        self.lock = Lock()
+
+    def get(self, name: str, metric_type, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.setdefault(name, metric_type(*args))
+        return metric
+
+    def counter(self, name: str) -> Counter:
+        return self.get(name, Counter)
+
+    def gauge(self, name: str) -> Gauge:
+        return self.get(name, Gauge)
+
+    def histogram(self, name: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.get(name, Histogram, buckets)
+
+    def snapshot(self) -> dict:
+        return {name: self.metrics[name].snapshot() for name in sorted(self.metrics)}
+
+    def export_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+_metrics = Metrics()
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+def timed(name: str):
+    """Decorator observing the duration of each call in the `name` histogram."""
+    def decorator(function):
+        histogram = _metrics.histogram(name)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - started)
+        return wrapper
+    return decorator
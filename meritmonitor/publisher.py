@@ -0,0 +1,430 @@
+import json
+import uuid
+import zlib
+import random
+import hashlib
+from threading import Thread, Condition, Event
+from time import monotonic, time, perf_counter
+
+from meritmonitor.database import Database
+from meritmonitor.thursday import get_last_thursday
+from meritmonitor.logger import get_logger
+from meritmonitor.metrics import get_metrics
+
+
+# Discord rejects messages longer than this
+MESSAGE_LIMIT = 2000
+# On average one in this many systems starts a new chunk
+CHUNK_BOUNDARY_EVERY = 32
+# Seconds to wait for a webhook or the aggregator to connect and to answer, a stalled request blocks the publisher
+REQUEST_TIMEOUT = 10
+
+
+def import_requests():
+    """`requests` takes longer to import than the rest of the plugin, so it is imported when first needed."""
+    import requests
+    return requests
+
+
+def hash_message(text: str) -> str:
+    h = hashlib.new('sha256')
+    byte_array = text.encode('utf-8')
+    h.update(byte_array)
+    return h.hexdigest()
+
+
+def chunk_report(header: str, system_lines: list[tuple[str, str]], limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    Split a report into messages of at most `limit` characters, `header` and
+    then one line per system in sorted order. A chunk ends before a system
+    picked by a hash of its name, or when the next line would not fit, so a
+    system that shows up later changes only the chunk it falls into, unless
+    it starts a new one.
+    """
+    chunks = []
+    chunk = [header]
+    length = len(header)
+    has_systems = False
+    for system, line in system_lines:
+        boundary = zlib.crc32(system.encode("utf-8")) % CHUNK_BOUNDARY_EVERY == 0
+        if has_systems and (boundary or length + len(line) > limit):
+            chunks.append("".join(chunk))
+            chunk, length = [], 0
+        chunk.append(line)
+        length += len(line)
+        has_systems = True
+    chunks.append("".join(chunk))
+    return chunks
+
+
+def decode_chunks(content: str) -> list[str]:
+    """Chunks of a report saved in the outbox, older releases saved a single message."""
+    try:
+        chunks = json.loads(content)
+    except ValueError:
+        return [content]
+    return chunks if isinstance(chunks, list) else [content]
+
+
+class RateLimit:
+    """Token bucket refilled from Discord's X-RateLimit-* and Retry-After response headers."""
+
+    def __init__(self) -> None:
+        self.limit = 1
+        self.remaining = 1
+        self.reset_at = 0.0
+
+    def wait_time(self) -> float:
+        now = monotonic()
+        if now >= self.reset_at:
+            self.remaining = max(self.remaining, self.limit)
+            return 0.0
+        if self.remaining > 0:
+            return 0.0
+        return self.reset_at - now
+
+    def take(self) -> None:
+        self.remaining -= 1
+
+    def update(self, response) -> None:
+        headers = response.headers
+        now = monotonic()
+        try:
+            if "X-RateLimit-Limit" in headers:
+                self.limit = int(headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Remaining" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset-After" in headers:
+                self.reset_at = now + float(headers["X-RateLimit-Reset-After"])
+            if response.status_code == 429:
+                self.remaining = 0
+                self.reset_at = max(self.reset_at, now + float(headers.get("Retry-After", 1)))
+        except ValueError as e:
+            get_logger().error("Neispravna Discord rate limit zaglavlja: %s", e)
+
+
+class DiscordPublisher:
+    """
+    Posts reports to the Discord webhook from its own thread.
+
+    Published reports go to the `outbox` table first, one row per week, so a
+    newer report replaces an older one that hasn't been sent yet. A report
+    stays in the outbox until Discord confirms it, failed sends are retried
+    with exponential backoff and jitter, also after a restart.
+
+    A report is a list of chunks, each sent as its own message. Only chunks
+    that changed since Discord last got them are sent again.
+    """
+    retry_base = 2
+    retry_cap = 300
+
+    def __init__(self, db_path: str, settings, translations, set_status_text) -> None:
+        self.db_path = db_path
+        self.settings = settings
+        self.translations = translations
+        self.set_status_text = set_status_text
+        self.db = None
+        self.session = None
+        self.rate_limit = RateLimit()
+        self.notified_of_missing_webhook = False
+
+        self.reports = {}
+        # Hashes of the reports Discord already has, by week
+        self.sent_hashes = {}
+        self.retry_now = False
+        self.report_ready = Condition()
+        self.stopping = Event()
+        self.thread = Thread(target=self.run, name='MeritMonitor Discord')
+        self.thread.daemon = True
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self.stopping.set()
+        with self.report_ready:
+            self.report_ready.notify()
+        self.thread.join(timeout=timeout)
+
+    def publish(self, chunks: list[str], timestamp: int | None = None, message_hash: str | None = None) -> None:
+        """Queue the report chunks for the week starting at `timestamp`, this week by default."""
+        if timestamp is None:
+            timestamp = int(get_last_thursday().timestamp())
+        if message_hash is None:
+            message_hash = hash_message("".join(chunks))
+        with self.report_ready:
+            self.reports[timestamp] = (chunks, message_hash)
+            self.report_ready.notify()
+
+    def retry(self) -> None:
+        """Send pending reports right away instead of waiting for the backoff, e.g. after a webhook change."""
+        with self.report_ready:
+            self.retry_now = True
+            self.report_ready.notify()
+
+    def take_reports(self, timeout: float | None) -> tuple[dict[int, tuple[list[str], str]], bool]:
+        with self.report_ready:
+            if not self.reports and not self.retry_now and not self.stopping.is_set():
+                self.report_ready.wait(timeout)
+            reports, self.reports = self.reports, {}
+            retry_now, self.retry_now = self.retry_now, False
+            return reports, retry_now
+
+    def retry_delay(self, attempts: int) -> float:
+        delay = min(self.retry_cap, self.retry_base * 2 ** attempts)
+        return max(random.uniform(delay / 2, delay), self.rate_limit.wait_time())
+
+    def run(self) -> None:
+        self.db = Database(self.db_path)
+        try:
+            while not self.stopping.is_set():
+                next_attempt = self.db.next_outbox_attempt()
+                timeout = None if next_attempt is None else max(0.0, next_attempt - time())
+                reports, retry_now = self.take_reports(timeout)
+                for timestamp, (chunks, message_hash) in reports.items():
+                    if self.sent_hashes.get(timestamp) == message_hash:
+                        continue
+                    self.sent_hashes.pop(timestamp, None)
+                    self.db.upsert_outbox_message(timestamp, json.dumps(chunks), message_hash, time())
+                if retry_now:
+                    self.db.reschedule_outbox(time())
+                self.drain_outbox()
+        finally:
+            if self.session:
+                self.session.close()
+            self.db.close()
+
+    def drain_outbox(self) -> None:
+        due = self.db.due_outbox_messages(time())
+        get_metrics().gauge("discord.outbox_due").set(len(due))
+        for timestamp, content, message_hash, attempts in due:
+            if self.stopping.is_set():
+                return
+            wait_time = self.rate_limit.wait_time()
+            if wait_time > 0:
+                get_logger().info("Discord rate limit, čekam %.1f s", wait_time)
+                self.db.reschedule_outbox_message(timestamp, attempts, time() + wait_time)
+                continue
+            try:
+                sent = self.post_to_discord(timestamp, decode_chunks(content))
+            except Exception as e:
+                get_logger().error("Greška pri slanju na Discord: %s", e)
+                sent = False
+            if sent:
+                self.sent_hashes[timestamp] = message_hash
+                self.db.delete_outbox_message(timestamp, message_hash)
+            else:
+                self.db.reschedule_outbox_message(timestamp, attempts + 1, time() + self.retry_delay(attempts))
+
+    def post_to_discord(self, timestamp: int, chunks: list[str]) -> bool:
+        """
+        Returns True once Discord has every chunk of the report, False if it
+        has to be sent again later. Chunks Discord already has are skipped,
+        so a retry picks up where a failed one stopped.
+        """
+        logger = get_logger()
+        webhook_url = self.settings.get_webhook_url()
+        if not webhook_url:
+            if not self.notified_of_missing_webhook:
+                self.set_status_text(self.translations.translate("Webhook URL nije podešen."))
+                self.notified_of_missing_webhook = True
+            return False
+
+        messages = self.db.lookup_discord_messages(timestamp)
+        updated = False
+        sent = False
+        for chunk, text in enumerate(chunks):
+            chunk_hash = hash_message(text)
+            message_id, existing_message_hash = messages.get(chunk, (None, None))
+            if existing_message_hash == chunk_hash:
+                logger.debug("Nema promena u delu %d Discord izveštaja.", chunk)
+                continue
+            if self.rate_limit.wait_time() > 0:
+                return False
+            if message_id:
+                logger.info("Аžuriram deo %d prethodne Discord poruke.", chunk)
+                response = self.send_request("patch", f"{webhook_url}/messages/{message_id}", {"content": text})
+            else:
+                logger.info("Šaljem novu Discord poruku, deo %d", chunk)
+                response = self.send_request("post", f"{webhook_url}?wait=true", {"content": text})
+            if response is None:
+                return False
+            self.db.upsert_discord_message(timestamp, chunk, response.get("id", message_id), chunk_hash)
+            updated = updated or bool(message_id)
+            sent = True
+
+        # The report got shorter, remove the messages of chunks it no longer has
+        for chunk in sorted(messages):
+            if chunk < len(chunks):
+                continue
+            if self.rate_limit.wait_time() > 0:
+                return False
+            logger.info("Brišem višak Discord poruke, deo %d", chunk)
+            if self.send_request("delete", f"{webhook_url}/messages/{messages[chunk][0]}") is None:
+                return False
+            self.db.delete_discord_message(timestamp, chunk)
+
+        if sent:
+            status_text = "Discord poruka ažurirana." if updated else "Uspešno poslato na Discord."
+            self.set_status_text(self.translations.translate(status_text))
+        return True
+
+    def send_request(self, method: str, url: str, payload: dict | None = None) -> dict | None:
+        """Send one webhook request, returning the decoded response or None if it has to be retried."""
+        logger = get_logger()
+        metrics = get_metrics()
+        requests = import_requests()
+        if self.session is None:
+            self.session = requests.Session()
+        try:
+            self.rate_limit.take()
+            started = perf_counter()
+            response = self.session.request(method, url, json=payload, timeout=REQUEST_TIMEOUT)
+            metrics.histogram("discord.round_trip_seconds").observe(perf_counter() - started)
+            metrics.counter("discord.requests").inc()
+            self.rate_limit.update(response)
+            if response.status_code == 429:
+                logger.info("Discord rate limit, pokušaću ponovo.")
+                metrics.counter("discord.rate_limited").inc()
+                return None
+            response.raise_for_status()
+            logger.debug("%s", response)
+            return response.json() if response.content else {}
+
+        except (requests.RequestException, ValueError) as e:
+            metrics.counter("discord.errors").inc()
+            error_message = self.translations.translate("Greška pri slanju:")
+            self.set_status_text(f"{error_message} {e}")
+            return None
+
+
+class AggregatorPublisher:
+    """
+    Pushes merit deltas to a squadron aggregator (see `meritmonitor.aggregator`)
+    instead of posting reports to Discord, the aggregator posts one report for
+    the whole squadron.
+
+    The deltas of each ledger flush are summed by week and system into one
+    batch by `outbox_batch`, which `MeritStore` saves in the `aggregator_outbox`
+    table in the same transaction as the merits, so merits saved to the ledger
+    are never lost before they are pushed. The outbox is sent every
+    `push_interval` seconds. A batch keeps its ID until the aggregator confirms
+    it, so a retry is never counted twice.
+    """
+    push_interval = 5
+    retry_base = 2
+    retry_cap = 300
+
+    def __init__(self, db_path: str, settings, translations, set_status_text) -> None:
+        self.db_path = db_path
+        self.settings = settings
+        self.translations = translations
+        self.set_status_text = set_status_text
+        self.db = None
+        self.session = None
+
+        self.retry_now = False
+        self.wake_up = Condition()
+        self.stopping = Event()
+        self.thread = Thread(target=self.run, name='MeritMonitor aggregator')
+        self.thread.daemon = True
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self.stopping.set()
+        with self.wake_up:
+            self.wake_up.notify()
+        self.thread.join(timeout=timeout)
+
+    def publish(self, chunks: list[str], timestamp: int | None = None, message_hash: str | None = None) -> None:
+        """Reports are posted by the aggregator."""
+
+    @staticmethod
+    def outbox_batch(deltas: list[tuple[int, str, int, int]]) -> tuple[str, str, float] | None:
+        """
+        The (batch_id, content, next_attempt) aggregator outbox row of
+        (week, system, merits, control_points) deltas, None without deltas.
+        """
+        totals = {}
+        for week, system, merits, control_points in deltas:
+            total = totals.setdefault((week, system), [0, 0])
+            total[0] += merits
+            total[1] += control_points
+        if not totals:
+            return None
+        content = [[week, system, merits, control_points] for (week, system), (merits, control_points) in totals.items()]
+        return str(uuid.uuid4()), json.dumps(content), time()
+
+    def retry(self) -> None:
+        with self.wake_up:
+            self.retry_now = True
+            self.wake_up.notify()
+
+    def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds, returns whether a retry was asked for meanwhile."""
+        with self.wake_up:
+            if not self.retry_now and not self.stopping.is_set():
+                self.wake_up.wait(timeout)
+            retry_now, self.retry_now = self.retry_now, False
+            return retry_now
+
+    def retry_delay(self, attempts: int) -> float:
+        delay = min(self.retry_cap, self.retry_base * 2 ** attempts)
+        return random.uniform(delay / 2, delay)
+
+    def run(self) -> None:
+        self.db = Database(self.db_path)
+        try:
+            while not self.stopping.is_set():
+                next_attempt = self.db.next_aggregator_attempt()
+                timeout = self.push_interval if next_attempt is None else \
+                    min(self.push_interval, max(0.0, next_attempt - time()))
+                if self.wait(timeout):
+                    self.db.reschedule_aggregator_outbox(time())
+                # Batches not sent by the time it stops are sent after the next start
+                if not self.stopping.is_set():
+                    self.drain_outbox()
+        finally:
+            if self.session:
+                self.session.close()
+            self.db.close()
+
+    def drain_outbox(self) -> None:
+        due = self.db.due_aggregator_batches(time())
+        get_metrics().gauge("aggregator.outbox_due").set(len(due))
+        for batch_id, content, attempts in due:
+            if self.stopping.is_set():
+                return
+            if self.post_batch(batch_id, content):
+                self.db.delete_aggregator_batch(batch_id)
+            else:
+                self.db.reschedule_aggregator_batch(batch_id, attempts + 1, time() + self.retry_delay(attempts))
+
+    def post_batch(self, batch_id: str, content: str) -> bool:
+        metrics = get_metrics()
+        url = self.settings.get_aggregator_url()
+        if not url:
+            return False
+        headers = {"Content-Type": "application/json"}
+        if self.settings.get_aggregator_token():
+            headers["Authorization"] = f"Bearer {self.settings.get_aggregator_token()}"
+        body = f'{{"batch": {json.dumps(batch_id)}, "deltas": {content}}}'
+        requests = import_requests()
+        if self.session is None:
+            self.session = requests.Session()
+        try:
+            started = perf_counter()
+            response = self.session.post(f"{url.rstrip('/')}/merits", data=body.encode("utf-8"), headers=headers,
+                                         timeout=REQUEST_TIMEOUT)
+            metrics.histogram("aggregator.round_trip_seconds").observe(perf_counter() - started)
+            metrics.counter("aggregator.requests").inc()
+            response.raise_for_status()
+        except requests.RequestException as e:
+            metrics.counter("aggregator.errors").inc()
+            get_logger().error("Greška pri slanju agregatoru: %s", e)
+            error_message = self.translations.translate("Greška pri slanju:")
+            self.set_status_text(f"{error_message} {e}")
+            return False
+        return True
@@ -2,16 +2,36 @@ import json
 import os
 
 
-def load_settings(file: str) -> dict[str, str]:
+def load_settings(file: str) -> dict[str, str | int | bool]:
     if not os.path.exists(file):
         return {}
     with open(file, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
+def positive_int(value, default: int) -> int:
+    """`value` as an int of at least 1, `default` if it isn't a number."""
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
 class Settings:
     language = "Srpski"
     webhook_url = ""
+    journal_workers = 1
+    worker_batch_size = 200
+    worker_batch_time_ms = 100
+    profile_startup = False
+    log_level = "INFO"
+    journal_scanner = "lines"
+    # Commander whose merits go in the Discord report, all commanders if empty
+    report_commander = ""
+    # "discord" posts reports to the webhook, "aggregator" pushes merits to a squadron aggregator
+    publisher_mode = "discord"
+    aggregator_url = ""
+    aggregator_token = ""
 
     def __init__(self, file: str) -> None:
         settings = load_settings(file)
@@ -19,6 +39,26 @@ class Settings:
             self.set_language(settings["language"])
         if "webhook_url" in settings:
             self.set_webhook_url(settings["webhook_url"])
+        if "journal_workers" in settings:
+            self.set_journal_workers(settings["journal_workers"])
+        if "worker_batch_size" in settings:
+            self.set_worker_batch_size(settings["worker_batch_size"])
+        if "worker_batch_time_ms" in settings:
+            self.set_worker_batch_time_ms(settings["worker_batch_time_ms"])
+        if "profile_startup" in settings:
+            self.set_profile_startup(settings["profile_startup"])
+        if "log_level" in settings:
+            self.set_log_level(settings["log_level"])
+        if "journal_scanner" in settings:
+            self.set_journal_scanner(settings["journal_scanner"])
+        if "report_commander" in settings:
+            self.set_report_commander(settings["report_commander"])
+        if "publisher_mode" in settings:
+            self.set_publisher_mode(settings["publisher_mode"])
+        if "aggregator_url" in settings:
+            self.set_aggregator_url(settings["aggregator_url"])
+        if "aggregator_token" in settings:
+            self.set_aggregator_token(settings["aggregator_token"])
 
     def get_language(self) -> str:
         return self.language
@@ -32,10 +72,80 @@ class Settings:
     def set_webhook_url(self, webhook_url: str) -> None:
         self.webhook_url = webhook_url
 
-    def as_dict(self) -> dict[str, str]:
+    def get_journal_workers(self) -> int:
+        return self.journal_workers
+
+    def set_journal_workers(self, journal_workers: int) -> None:
+        self.journal_workers = positive_int(journal_workers, self.journal_workers)
+
+    def get_worker_batch_size(self) -> int:
+        return self.worker_batch_size
+
+    def set_worker_batch_size(self, worker_batch_size: int) -> None:
+        self.worker_batch_size = positive_int(worker_batch_size, self.worker_batch_size)
+
+    def get_worker_batch_time_ms(self) -> int:
+        return self.worker_batch_time_ms
+
+    def set_worker_batch_time_ms(self, worker_batch_time_ms: int) -> None:
+        self.worker_batch_time_ms = positive_int(worker_batch_time_ms, self.worker_batch_time_ms)
+
+    def get_profile_startup(self) -> bool:
+        return self.profile_startup
+
+    def set_profile_startup(self, profile_startup: bool) -> None:
+        self.profile_startup = bool(profile_startup)
+
+    def get_log_level(self) -> str:
+        return self.log_level
+
+    def set_log_level(self, log_level: str) -> None:
+        self.log_level = log_level
+
+    def get_journal_scanner(self) -> str:
+        return self.journal_scanner
+
+    def set_journal_scanner(self, journal_scanner: str) -> None:
+        self.journal_scanner = journal_scanner
+
+    def get_report_commander(self) -> str:
+        return self.report_commander
+
+    def set_report_commander(self, report_commander: str) -> None:
+        self.report_commander = report_commander
+
+    def get_publisher_mode(self) -> str:
+        return self.publisher_mode
+
+    def set_publisher_mode(self, publisher_mode: str) -> None:
+        self.publisher_mode = publisher_mode
+
+    def get_aggregator_url(self) -> str:
+        return self.aggregator_url
+
+    def set_aggregator_url(self, aggregator_url: str) -> None:
+        self.aggregator_url = aggregator_url
+
+    def get_aggregator_token(self) -> str:
+        return self.aggregator_token
+
+    def set_aggregator_token(self, aggregator_token: str) -> None:
+        self.aggregator_token = aggregator_token
+
+    def as_dict(self) -> dict[str, str | int | bool]:
         return {
             "language": self.language,
-            "webhook_url": self.webhook_url
+            "webhook_url": self.webhook_url,
+            "journal_workers": self.journal_workers,
+            "worker_batch_size": self.worker_batch_size,
+            "worker_batch_time_ms": self.worker_batch_time_ms,
+            "profile_startup": self.profile_startup,
+            "log_level": self.log_level,
+            "journal_scanner": self.journal_scanner,
+            "report_commander": self.report_commander,
+            "publisher_mode": self.publisher_mode,
+            "aggregator_url": self.aggregator_url,
+            "aggregator_token": self.aggregator_token
         }
 
     def save_settings(self, file: str):
@@ -0,0 +1,48 @@
+"""
+Snapshot of the `MeritStore` totals and the journal position they include,
+so the plugin can show totals right away at startup, before the database is
+opened and the journals are scanned.
+
+The totals include every ledger change up to revision `ledger_until`, see
+`Database.ledger_revision`. A snapshot whose `ledger_until` doesn't match the
+ledger (merits saved after it was written and a crash before the next one, a
+deleted database) is only used until the totals are rebuilt from the ledger.
+"""
+import os
+import json
+
+from meritmonitor.logger import get_logger
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_KEYS = ("week", "systems", "weeks", "ledger_until", "journal")
+
+
+def save_snapshot(path: str, merit_store, ledger_until: int, commander: str, system: str,
+                  system_state: str) -> None:
+    """Write the snapshot to a temporary file first, so a crash can't leave half of it behind."""
+    snapshot = merit_store.to_snapshot()
+    snapshot["version"] = SNAPSHOT_VERSION
+    snapshot["ledger_until"] = ledger_until
+    snapshot["journal"] = [commander, system, system_state]
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temporary_path, path)
+
+
+def load_snapshot(path: str) -> dict | None:
+    """The snapshot saved in `path`, None if there is none or it can't be used."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        get_logger().error("Greška pri čitanju snimka merita %s: %s", path, e)
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    if any(key not in snapshot for key in SNAPSHOT_KEYS) or type(snapshot["ledger_until"]) is not int:
+        get_logger().error("Neispravan snimak merita %s", path)
+        return None
+    return snapshot
@@ -0,0 +1,192 @@
+"""
+SQLite connections of the plugin's databases.
+
+The databases are in WAL mode, so reading never waits for writing and every
+read sees the last committed transaction. Each database file has a single
+writer connection per process, owned by a `DatabaseWriter` thread. Every
+other connection is opened read-only.
+"""
+import os
+import sqlite3
+from concurrent.futures import Future, wait
+from queue import Queue, Empty
+from threading import Thread, Lock
+from time import perf_counter
+from urllib.parse import quote
+
+from meritmonitor.logger import get_logger
+from meritmonitor.metrics import get_metrics
+
+# Page cache of each connection, negative cache_size is in KiB
+CACHE_SIZE_KIB = 8 * 1024
+# Prepared statements kept by each connection, more than Database has distinct queries
+CACHED_STATEMENTS = 256
+# Seconds a connection waits for a lock held by another process before it gives up
+BUSY_TIMEOUT = 10
+# Write requests committed in one transaction at most
+MAX_WRITE_GROUP = 1000
+WRITE_GROUP_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def connect(db_path: str, read_only: bool = False) -> sqlite3.Connection:
+    """
+    A connection with the plugin's pragmas. The writer connection is in
+    autocommit mode, `DatabaseWriter` begins and commits its transactions itself.
+    """
+    if read_only:
+        path = os.path.abspath(db_path).replace(os.sep, "/")
+        uri = f"file:{quote(path if path.startswith('/') else '/' + path, safe='/:')}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS)
+    else:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS,
+                               isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        # In WAL mode only checkpoints wait for the disk, a power cut can lose the last commits but not corrupt the file
+        conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+class DatabaseWriter:
+    """
+    The writer connection of one database file, on its own thread.
+
+    Write requests are functions of the connection, queued from any thread by
+    `submit` and run in the order they were queued. The requests waiting
+    together are committed in one transaction, each in its own savepoint, so
+    a failing request is rolled back alone and gets the exception in its
+    future. A future is done once its transaction is committed.
+
+    `migrate` brings the schema up to date before the first request.
+    """
+
+    def __init__(self, db_path: str, migrate=None) -> None:
+        self.db_path = db_path
+        self.migrate = migrate
+        self.requests: Queue = Queue()
+        self.ready: Future = Future()
+        self.last_request: Future | None = None
+        self.submit_lock = Lock()
+        self.users = 0
+        self.thread = Thread(target=self.run, name='MeritMonitor SQLite')
+        self.thread.daemon = True
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Commit the queued requests and close the connection."""
+        self.requests.put(None)
+        self.thread.join()
+
+    def submit(self, function, *args) -> Future:
+        future = Future()
+        with self.submit_lock:
+            self.requests.put((future, function, args))
+            self.last_request = future
+        return future
+
+    def wait(self) -> None:
+        """Wait until every request queued so far is committed or failed."""
+        last_request = self.last_request
+        if last_request is not None:
+            wait([last_request])
+
+    def run(self) -> None:
+        try:
+            conn = connect(self.db_path)
+        except Exception as e:
+            self.ready.set_exception(e)
+            return
+        try:
+            if self.migrate:
+                self.migrate(conn)
+            self.ready.set_result(None)
+        except Exception as e:
+            conn.close()
+            self.ready.set_exception(e)
+            return
+        try:
+            stopping = False
+            while not stopping:
+                request = self.requests.get()
+                if request is None:
+                    break
+                group = [request]
+                while len(group) < MAX_WRITE_GROUP:
+                    try:
+                        request = self.requests.get_nowait()
+                    except Empty:
+                        break
+                    if request is None:
+                        stopping = True
+                        break
+                    group.append(request)
+                self.commit(conn, group)
+        finally:
+            conn.close()
+
+    def commit(self, conn: sqlite3.Connection, group: list) -> None:
+        started = perf_counter()
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for future, function, args in group:
+                conn.execute("SAVEPOINT request")
+                try:
+                    results.append((future, function(conn, *args), None))
+                    conn.execute("RELEASE request")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO request")
+                    conn.execute("RELEASE request")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            # The transaction itself failed, e.g. another process kept the database locked, nothing was saved
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(future, None, e) for future, _, _ in group]
+
+        metrics = get_metrics()
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                get_logger().error("Greška pri upisu u bazu: %s", error)
+                metrics.counter("database.write_errors").inc()
+                future.set_exception(error)
+        metrics.histogram("database.write_group_size", WRITE_GROUP_BUCKETS).observe(len(group))
+        metrics.histogram("database.commit_seconds").observe(perf_counter() - started)
+
+
+writers: dict[str, DatabaseWriter] = {}
+writers_lock = Lock()
+
+
+def acquire_writer(db_path: str, migrate=None) -> DatabaseWriter:
+    """The writer of `db_path`, started by its first user. Raises if the database can't be opened or migrated."""
+    key = os.path.abspath(db_path)
+    with writers_lock:
+        writer = writers.get(key)
+        if writer is None:
+            writer = writers[key] = DatabaseWriter(key, migrate)
+            writer.start()
+        writer.users += 1
+    try:
+        writer.ready.result()
+    except Exception:
+        release_writer(writer)
+        raise
+    return writer
+
+
+def release_writer(writer: DatabaseWriter) -> None:
+    """Stop the writer once its last user is done with it."""
+    with writers_lock:
+        writer.users -= 1
+        if writer.users > 0:
+            return
+        if writers.get(writer.db_path) is writer:
+            del writers[writer.db_path]
+    writer.stop()
@@ -1,8 +1,20 @@
 from datetime import datetime, timedelta, timezone
+from time import time
+
+SECONDS_PER_WEEK = 7 * 24 * 60 * 60
+# PP cycles start on Thursdays at 07:00 UTC, and the Unix epoch was a Thursday
+CYCLE_START_OFFSET = 7 * 60 * 60
+
+
+def week_start(timestamp: int) -> int:
+    """Start of the PP cycle `timestamp` is in, both Unix timestamps."""
+    return (timestamp - CYCLE_START_OFFSET) // SECONDS_PER_WEEK * SECONDS_PER_WEEK + CYCLE_START_OFFSET
 
 
 def get_last_thursday() -> datetime:
-    now = datetime.now(timezone.utc)
-    thursday = now - timedelta(days=(now.weekday() + 4) % 7)
-    thursday = thursday.replace(hour=7, minute=0, second=0, microsecond=0)
-    return thursday
+    """Start of the current PP cycle, the last Thursday 07:00 UTC (still last week's before 07:00 on a Thursday)."""
+    return datetime.fromtimestamp(week_start(int(time())), tz=timezone.utc)
+
+
+def get_next_thursday() -> datetime:
+    return get_last_thursday() + timedelta(days=7)
@@ -0,0 +1,148 @@
+import os
+import cProfile
+import pstats
+from datetime import datetime, timezone
+
+from meritmonitor.meritcalculator import control_points_from_merits_gained
+from meritmonitor.meritstore import MeritStore, UNKNOWN_COMMANDER
+from meritmonitor.journalfiles import find_journals
+from meritmonitor.journal import scan_journals, apply_journal_scan, save_journal_checkpoints, format_timestamp, parse_timestamp
+from meritmonitor.thursday import get_last_thursday
+from meritmonitor.metrics import timed
+from meritmonitor.logger import get_logger
+from meritmonitor.fingerprints import TieSequence
+
+
+class MeritTracker:
+    """
+    Journal ingestion and merit calculation without the EDMC GUI: loads
+    merits from the journal files and follows live journal events, adding
+    them to `merit_store`.
+
+    Without a database nothing is checkpointed or saved, every load reads the
+    journals from the start of its window. `MeritMonitor` builds the plugin
+    on top of this, `python -m meritmonitor` uses it on its own.
+    """
+    last_seen_commander = UNKNOWN_COMMANDER
+    last_seen_system = "Nepoznato"
+    last_seen_system_state = "Unoccupied"
+
+    def __init__(self, merit_store=None, db=None, journal_dir: str = "", workers: int = 1,
+                 scanner: str = "lines", logger=None) -> None:
+        self.merit_store = merit_store if merit_store is not None else MeritStore(db)
+        self.db = db
+        self.journal_dir = journal_dir
+        self.workers = workers
+        self.scanner = scanner
+        self.logger = logger
+        self.live_ties = TieSequence()
+
+    def get_journal_dir(self) -> str:
+        return self.journal_dir
+
+    def get_journal_workers(self) -> int:
+        return self.workers
+
+    def get_journal_scanner(self) -> str:
+        return self.scanner
+
+    def update_live_status(self):
+        pass
+
+    def get_logger(self):
+        """The logger passed in, or the plugin's, looked up when first used so its log file can be set after this."""
+        if self.logger is None:
+            self.logger = get_logger()
+        return self.logger
+
+    @timed("journal.load_seconds")
+    def load_merits_since(self, timestamp: datetime, until: datetime | None = None):
+        """
+        Add merits from journals since `timestamp` (and before `until`). Only
+        the journal lines after the checkpoints are read, and `merit_store`
+        skips events it has already counted.
+        """
+        journal_dir = os.path.expanduser(self.get_journal_dir())
+        since = self.to_unix_time(timestamp)
+        until = self.to_unix_time(until) if until else 0
+        if self.db:
+            self.db.delete_journal_checkpoints_except(since)
+
+        filenames = find_journals(self.db, journal_dir, format_timestamp(since),
+                                  format_timestamp(until) if until else None)
+
+        scans = scan_journals(self.db, filenames, since, self.get_journal_workers(), self.get_journal_scanner(), until)
+        # Merits before the first jump of the window get the same system in every load
+        carry = (UNKNOWN_COMMANDER, MeritTracker.last_seen_system, MeritTracker.last_seen_system_state)
+        for scan in scans:
+            carry = apply_journal_scan(scan, self.merit_store, *carry)
+        if scans:
+            self.last_seen_commander, self.last_seen_system, self.last_seen_system_state = carry
+        self.merit_store.flush()
+        if self.db:
+            save_journal_checkpoints(self.db, scans)
+        self.update_live_status()
+
+    @staticmethod
+    def to_unix_time(timestamp: datetime) -> int:
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return int(timestamp.timestamp())
+
+    def load_today_merits(self):
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.load_merits_since(today)
+
+    def load_full_pp_cycle(self):
+        thursday = get_last_thursday()
+        self.load_merits_since(thursday)
+
+    def on_location(self, entry) -> bool:
+        self.last_seen_system = entry.get("StarSystem", self.last_seen_system or "Nepoznato")
+        self.last_seen_system_state = entry.get("PowerplayState", self.last_seen_system_state)
+        return False
+
+    def on_powerplay_merits(self, entry) -> bool:
+        net_merits_gained = entry.get("MeritsGained") or 0
+
+        system_control_points_gained = control_points_from_merits_gained(self.last_seen_system_state, net_merits_gained)
+
+        timestamp = parse_timestamp(entry["timestamp"]) if "timestamp" in entry else None
+        sequence = self.live_ties.next(timestamp, self.last_seen_commander, net_merits_gained)
+        if not self.merit_store.add_merits(self.last_seen_system, self.last_seen_system_state, net_merits_gained,
+                                           system_control_points_gained, timestamp, self.last_seen_commander, sequence):
+            self.get_logger().debug("Već uračunato: %s merita za %s", net_merits_gained, self.last_seen_system)
+            return False
+        self.get_logger().debug("Dodato: %s merita za %s (%s)", net_merits_gained, self.last_seen_system, self.last_seen_system_state)
+        return True
+
+    def on_commander(self, entry) -> bool:
+        self.last_seen_commander = entry.get("Name" if entry.get("event") == "Commander" else "Commander",
+                                             self.last_seen_commander)
+        return False
+
+    # Journal events handled by process_journal_entry, the handlers return True if merits changed
+    event_handlers = {
+        "FSDJump": on_location,
+        "Location": on_location,
+        "PowerplayMerits": on_powerplay_merits,
+        "Commander": on_commander,
+        "LoadGame": on_commander,
+    }
+
+    def process_journal_entry(self, entry, system=None, cmdr=None) -> bool:
+        if cmdr:
+            self.last_seen_commander = cmdr
+        handler = self.event_handlers.get(entry.get("event"))
+        if handler is None:
+            return False
+        return handler(self, entry)
+
+    def profile(self, function, path: str):
+        """Run `function` under cProfile, saving `path`.prof and a text summary in `path`.txt."""
+        profiler = cProfile.Profile()
+        profiler.runcall(function)
+        profiler.dump_stats(f"{path}.prof")
+        with open(f"{path}.txt", "w", encoding="utf-8") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+        self.get_logger().info("Profil učitavanja sačuvan u %s.prof", path)
@@ -8,6 +8,7 @@ class Translations:
 
     languages = {}
     translations = {}
+    language = ""
 
     def __init__(self, lang_dir: str):
         self.translations_dir = lang_dir
@@ -18,6 +19,7 @@ class Translations:
 
     def load(self, language: str) -> None:
         self.translations = {}
+        self.language = language
 
         file_name = self.languages.get(language, "Srpski.json")
         full_path = os.path.join(self.translations_dir, file_name)
@@ -26,7 +28,7 @@ class Translations:
                 with open(full_path, "r", encoding="utf-8") as f:
                     self.translations = json.load(f)
             except Exception as e:
-                get_logger().error(f"Greška pri učitavanju prevoda: {e}")
+                get_logger().error("Greška pri učitavanju prevoda: %s", e)
 
     def translate(self, text: str) -> str:
         return self.translations.get(text, text)
@@ -0,0 +1,114 @@
+"""
+Merit events are counted once, however often the journals are scanned and
+whether an event comes from a scan or from the live events.
+
+    python -m unittest tests.test_fingerprints
+"""
+import os
+import json
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+from meritmonitor.database import Database
+from meritmonitor.meritstore import MeritStore
+from meritmonitor.thursday import week_start
+from meritmonitor.tracker import MeritTracker
+from meritmonitor.logger import set_global_log_file, set_log_level
+
+SINCE = datetime(2026, 10, 15, 7, 0, tzinfo=timezone.utc)
+WEEK = int(SINCE.timestamp())
+JOURNAL = [
+    {"timestamp": "2026-10-16T08:00:00Z", "event": "Location", "StarSystem": "Sol"},
+    {"timestamp": "2026-10-16T08:05:00Z", "event": "PowerplayMerits", "MeritsGained": 100},
+    {"timestamp": "2026-10-16T08:10:00Z", "event": "FSDJump", "StarSystem": "Achenar"},
+    {"timestamp": "2026-10-16T08:15:00Z", "event": "PowerplayMerits", "MeritsGained": 50},
+]
+
+
+class FingerprintTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        set_global_log_file(os.path.join(self.directory.name, "meritmonitor.log"))
+        set_log_level("WARNING")
+        self.journal_dir = os.path.join(self.directory.name, "journals")
+        os.mkdir(self.journal_dir)
+        self.db_path = os.path.join(self.directory.name, "merits.db")
+        self.databases = []
+
+    def tearDown(self) -> None:
+        for db in self.databases:
+            db.close()
+        self.directory.cleanup()
+
+    def write_journal(self, entries: list[dict]) -> None:
+        with open(os.path.join(self.journal_dir, "Journal.2026-10-16T080000.01.log"), "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+
+    def tracker(self) -> MeritTracker:
+        db = Database(self.db_path)
+        self.databases.append(db)
+        merit_store = MeritStore(db)
+        merit_store.load(WEEK)
+        return MeritTracker(merit_store, db, self.journal_dir)
+
+    def control_points(self, tracker: MeritTracker) -> dict[str, int]:
+        return {system: int(line.split("**")[1])
+                for system, line in tracker.merit_store.get_control_points_by_system_lines(week=WEEK)}
+
+    def test_live_events_overlapping_the_scan_are_counted_once(self) -> None:
+        self.write_journal(JOURNAL)
+        tracker = self.tracker()
+        tracker.load_merits_since(SINCE)
+        # EDMC queued the same events while the scan ran, the scan left the tracker in the last system
+        for entry in JOURNAL[1:]:
+            tracker.process_journal_entry(entry)
+        tracker.merit_store.flush()
+
+        self.assertEqual(tracker.merit_store.sum_personal(week=WEEK), 150)
+        self.assertEqual(self.control_points(tracker), {"Achenar": 12, "Sol": 25})
+
+    def test_rescans_and_restarts_count_events_once(self) -> None:
+        self.write_journal(JOURNAL)
+        tracker = self.tracker()
+        tracker.load_merits_since(SINCE)
+        tracker.db.delete_journal_checkpoints_except(0)
+        tracker.load_merits_since(SINCE)
+
+        restarted = self.tracker()
+        restarted.db.delete_journal_checkpoints_except(0)
+        restarted.load_merits_since(SINCE)
+
+        self.assertEqual(restarted.merit_store.sum_personal(week=WEEK), 150)
+        self.assertEqual(self.control_points(restarted), {"Achenar": 12, "Sol": 25})
+
+    def test_identical_events_in_the_same_second_are_all_counted(self) -> None:
+        merits = {"timestamp": "2026-10-16T08:20:00Z", "event": "PowerplayMerits", "MeritsGained": 8}
+        other = {"timestamp": "2026-10-16T08:20:00Z", "event": "PowerplayMerits", "MeritsGained": 4}
+        self.write_journal(JOURNAL + [merits, other, merits])
+        tracker = self.tracker()
+        tracker.load_merits_since(SINCE)
+        for entry in [merits, other, merits]:
+            tracker.process_journal_entry(entry)
+        tracker.merit_store.flush()
+
+        self.assertEqual(tracker.merit_store.sum_personal(week=WEEK), 170)
+        self.assertEqual(len(tracker.db.load_fingerprints(week_start(WEEK))), 5)
+
+    def test_identical_events_of_two_commanders_are_both_counted(self) -> None:
+        merits = {"timestamp": "2026-10-16T08:20:00Z", "event": "PowerplayMerits", "MeritsGained": 50}
+        self.write_journal([{"timestamp": "2026-10-16T08:00:00Z", "event": "Commander", "Name": "Alice"}, merits])
+        tracker = self.tracker()
+        tracker.load_merits_since(SINCE)
+        # Bob earns the same merits in the same second, EDMC passes the event live
+        tracker.process_journal_entry(merits, cmdr="Bob")
+        tracker.merit_store.flush()
+
+        self.assertEqual(tracker.merit_store.sum_personal(week=WEEK), 100)
+        self.assertEqual(tracker.merit_store.sum_personal("Alice", WEEK), 50)
+        self.assertEqual(tracker.merit_store.sum_personal("Bob", WEEK), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+The Discord outbox against a local webhook stub: failed sends stay in the
+outbox across a restart and Discord's message IDs are only saved once it
+accepted the message.
+
+    python -m unittest tests.test_outbox
+"""
+import os
+import json
+import tempfile
+import unittest
+from time import monotonic, sleep
+
+from benchmarks.discord_stub import DiscordStub
+from meritmonitor.aggregator import AggregatorSettings
+from meritmonitor.database import Database
+from meritmonitor.publisher import DiscordPublisher
+from meritmonitor.translations import Translations
+from meritmonitor.logger import set_global_log_file, set_log_level
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEEK = 1_790_000_000
+CHUNKS = ["📊 **Sistemski meriti po sistemima:**\n\nSol: 100\n", "Achenar: 50\n"]
+FAILED_REQUESTS = 3
+
+
+def wait_for(condition, timeout: float = 10) -> None:
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            raise AssertionError("timed out")
+        sleep(0.01)
+
+
+class OutboxTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        set_global_log_file(os.path.join(self.directory.name, "meritmonitor.log"))
+        set_log_level("WARNING")
+        self.db_path = os.path.join(self.directory.name, "merits.db")
+        self.db = Database(self.db_path)
+        self.translations = Translations(os.path.join(ROOT, "lang"))
+        self.translations.load("English")
+
+    def tearDown(self) -> None:
+        self.db.close()
+        self.directory.cleanup()
+
+    def publisher(self, url: str) -> DiscordPublisher:
+        publisher = DiscordPublisher(self.db_path, AggregatorSettings(url), self.translations, lambda text: None)
+        publisher.start()
+        return publisher
+
+    def outbox_attempts(self) -> list[int]:
+        return [attempts for _, _, _, attempts in self.db.due_outbox_messages(float("inf"))]
+
+    def test_failed_report_is_resumed_after_restart(self) -> None:
+        with DiscordStub(rate_limit=0, fail_first=FAILED_REQUESTS) as stub:
+            publisher = self.publisher(stub.url)
+            # Retry right away until every failure is used up, then late enough to restart first
+            publisher.retry_delay = lambda attempts: 0.01 if attempts < FAILED_REQUESTS - 1 else 1.0
+            publisher.publish(CHUNKS, WEEK)
+            wait_for(lambda: self.outbox_attempts() == [FAILED_REQUESTS])
+            publisher.stop()
+
+            self.assertEqual(len(stub.requests), FAILED_REQUESTS)
+            self.assertEqual(stub.messages, {})
+            self.assertEqual(self.db.lookup_discord_messages(WEEK), {})
+            (timestamp, content, _, _), = self.db.due_outbox_messages(float("inf"))
+            self.assertEqual((timestamp, json.loads(content)), (WEEK, CHUNKS))
+
+            publisher = self.publisher(stub.url)
+            wait_for(lambda: self.outbox_attempts() == [])
+            publisher.stop()
+
+        self.assertEqual(sorted(stub.messages.values()), sorted(CHUNKS))
+        messages = self.db.lookup_discord_messages(WEEK)
+        self.assertEqual(sorted(messages), [0, 1])
+        self.assertEqual({stub.messages[message_id] for message_id, _ in messages.values()}, set(CHUNKS))
+
+
+if __name__ == "__main__":
+    unittest.main()